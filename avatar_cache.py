@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import re
+from io import BytesIO
+
+from PIL import Image
+
+from coalescing_cache import CoalescingCache
+from render_resources import create_rounded_mask
+
+AVATAR_CACHE_DIR = "./avatar_cache/"  # Processed avatars, one PNG per avatar hash
+AVATAR_SIZE = (57, 58)  # Size of the profile picture on the leaderboard
+AVATAR_FETCH_SIZE = 64  # Smallest CDN size that covers AVATAR_SIZE
+AVATAR_MEMORY_ITEMS = 256  # Processed avatars kept in memory
+AVATAR_MAX_CONCURRENCY = 4  # Parallel CDN downloads
+AVATAR_FETCH_TIMEOUT = 5  # Seconds per download
+
+logger = logging.getLogger(__name__)
+
+
+# Function to round the corners of a profile picture
+def round_pfp(img_pfp):
+    # Ensure the image is in RGBA mode to support transparency
+    img_pfp = img_pfp.convert('RGBA')
+
+    # Rounded mask with the size of the image (memoized per size)
+    mask = create_rounded_mask(img_pfp.size)
+
+    img_pfp.putalpha(mask)  # Apply the rounded mask as alpha (transparency)
+    return img_pfp
+
+
+# Function to resize and round a downloaded avatar, returning PNG bytes
+def process_avatar(raw_bytes):
+    img_pfp = Image.open(BytesIO(raw_bytes))
+    img_pfp = img_pfp.resize(AVATAR_SIZE)
+    img_pfp = round_pfp(img_pfp)
+    output = BytesIO()
+    img_pfp.save(output, format="PNG")
+    return output.getvalue()
+
+
+# Function to get the cache key for a member's avatar
+def avatar_key(member):
+    if member.avatar:
+        return member.avatar  # Avatar hash; changes whenever the avatar changes
+    return f"default-{int(member.discriminator) % 5}"
+
+
+class AvatarCache:
+    """
+    Downloads leaderboard avatars concurrently and keeps them processed.
+
+    Avatars are keyed by avatar hash and stored already resized and rounded,
+    in an LRU in memory and as PNGs on disk, so an unchanged avatar is
+    downloaded and masked once. Downloads go through discord.py's own HTTP
+    session (Asset.read), are bounded by a semaphore and time out after
+    AVATAR_FETCH_TIMEOUT seconds. Concurrent requests for the same key share
+    one download.
+    """
+
+    def __init__(self, cache_dir=AVATAR_CACHE_DIR, max_items=AVATAR_MEMORY_ITEMS,
+                 concurrency=AVATAR_MAX_CONCURRENCY, timeout=AVATAR_FETCH_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._memory = CoalescingCache(max_items)  # key -> processed PNG bytes
+        self._semaphore = None  # Created on first use, inside the running loop
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, re.sub(r"[^\w-]", "_", key) + ".png")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _process_and_store(self, key, raw_bytes):
+        data = process_avatar(raw_bytes)
+        try:
+            with open(self._path(key), "wb") as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Could not write avatar cache file for {key}: {e}")
+        return data
+
+    async def _load(self, key, asset):
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, self._read_disk, key)
+        if data is None:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+            async with self._semaphore:
+                raw_bytes = await asyncio.wait_for(asset.read(), self.timeout)
+            # Pillow work runs in a thread so the event loop keeps going
+            data = await loop.run_in_executor(None, self._process_and_store, key, raw_bytes)
+        return data
+
+    async def get(self, key, asset):
+        """Return processed PNG bytes for an avatar, or None if it could not be fetched."""
+        try:
+            return await self._memory.get(key, self._load, key, asset)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to fetch avatar {key}: {e!r}")
+            return None
+
+    async def get_many(self, items):
+        """Fetch [(key, asset), ...] concurrently; returns bytes or None per item, in order."""
+        return await asyncio.gather(*(self.get(key, asset) for key, asset in items))
+
+
+avatar_cache = AvatarCache()
@@ -0,0 +1,70 @@
+"""
+SQLite write throughput for the XP tables.
+
+Times update_user_xp (one transaction per award), update_bulk_xp and
+write_xp_batch (the write-behind flush) against a fresh database in the
+benchmark work directory.
+
+    python benchmarks/bench_db.py --writes 5000 --batches 50 --output db.json
+"""
+import argparse
+import os
+import random
+import time
+
+from harness import prepare_workdir, report, summarize
+
+
+def run(writes=5000, batches=50, batch_size=500, users=10000, seed=0):
+    import db_server
+
+    rng = random.Random(seed)
+    user_ids = [str(100000 + i) for i in range(users)]
+    results = {}
+
+    # One commit per call, as on_message used to do
+    samples = []
+    started = time.perf_counter()
+    for _ in range(writes):
+        user_id, xp = rng.choice(user_ids), rng.randint(1, 50)
+        t0 = time.perf_counter()
+        db_server.update_user_xp(user_id, xp)
+        samples.append(time.perf_counter() - t0)
+    results["update_user_xp"] = summarize(samples, time.perf_counter() - started)
+
+    # Batched writes: one transaction per batch of batch_size users
+    for name in ("update_bulk_xp", "write_xp_batch"):
+        samples = []
+        started = time.perf_counter()
+        for _ in range(batches):
+            batch = {user_id: rng.randint(1, 500) for user_id in rng.sample(user_ids, batch_size)}
+            t0 = time.perf_counter()
+            if name == "update_bulk_xp":
+                db_server.update_bulk_xp(list(batch.items()))
+            else:
+                db_server.write_xp_batch(batch)
+            samples.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(samples, elapsed)
+        results[name]["batch_size"] = batch_size
+        results[name]["rows_per_sec"] = round(batches * batch_size / sum(samples), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    prepare_workdir()
+    report({"db": run(args.writes, args.batches, args.batch_size, args.users, args.seed)}, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+End-to-end create_leaderboard_image latency.
+
+Ranks stub members in the XP index and times bot.create_leaderboard_image:
+member lookup, avatars from the avatar cache and the render worker. After
+a warm-up (font, sprites, avatars and the worker all cached) it measures
+renders where one of the top 10 gained XP, which is the normal case on a
+busy server, and renders where nothing changed, which the render cache
+serves without drawing.
+
+    python benchmarks/bench_render.py --iterations 50 --output render.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from harness import StubGuild, StubMember, make_avatar_png, prepare_workdir, report, summarize
+
+NICKNAMES = ["Goku", "vegeta 🔥", "Piccolo", "trunks👨‍💻", "bulma ✨✨", "krillin", "Yamcha😂", "Gohan", "Videl", "Beerus 💀"]
+
+
+def run(iterations=50, warmup=3, members=50, seed=0):
+    import bot as bot_module
+    from leaderboard_index import xp_index
+
+    rng = random.Random(seed)
+    stub_members = [
+        StubMember(
+            200000 + i,
+            nick=NICKNAMES[i % len(NICKNAMES)],
+            avatar=f"avatarhash{i}",
+            avatar_bytes=make_avatar_png(i),
+        )
+        for i in range(members)
+    ]
+    guild = StubGuild(bot_module.GUILD_ID, stub_members)
+    bot_module.bot.get_guild = {guild.id: guild}.get
+    xp_index.rebuild((member.id, rng.randint(1000, 100000)) for member in stub_members)
+
+    async def render_once():
+        t0 = time.perf_counter()
+        await bot_module.create_leaderboard_image()
+        return time.perf_counter() - t0
+
+    async def drive():
+        cold = await render_once()  # Starts the worker, downloads avatars, loads fonts
+        for _ in range(warmup - 1):
+            await render_once()
+
+        changed = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            user_id, _ = rng.choice(xp_index.top(10))
+            xp_index.add(user_id, rng.randint(100, 5000))
+            changed.append(await render_once())
+        changed_elapsed = time.perf_counter() - started
+
+        unchanged = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            unchanged.append(await render_once())
+        return cold, (changed, changed_elapsed), (unchanged, time.perf_counter() - started)
+
+    try:
+        cold, changed, unchanged = asyncio.get_event_loop().run_until_complete(drive())
+    finally:
+        if bot_module.render_pool is not None:
+            bot_module.render_pool.shutdown()
+
+    return {
+        "cold_ms": round(cold * 1000, 2),
+        "top10_changed": summarize(*changed),
+        "unchanged": summarize(*unchanged),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    prepare_workdir()
+    report({"render": run(args.iterations, args.warmup, args.members, args.seed)}, output)
+
+
+if __name__ == "__main__":
+    main()
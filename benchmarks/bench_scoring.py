@@ -0,0 +1,74 @@
+"""
+Messages per second through the on_message XP path.
+
+Scores a synthetic corpus with xp_scorer alone, then feeds the same
+messages from stub members through bot.on_message (scoring, the
+write-behind buffer, its flushes and process_commands).
+
+    python benchmarks/bench_scoring.py --messages 20000 --output scoring.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from harness import (
+    StubMember, StubMessage, log_in_stub_user, message_corpus, prepare_workdir, report, summarize,
+)
+
+
+def run(messages=20000, users=10000, seed=0):
+    from xp_scorer import xp_scorer
+    import bot as bot_module
+
+    corpus = message_corpus(messages, seed)
+    results = {}
+
+    # The scorer on its own
+    samples = []
+    started = time.perf_counter()
+    for content in corpus:
+        t0 = time.perf_counter()
+        xp_scorer.score(content)
+        samples.append(time.perf_counter() - t0)
+    results["xp_scorer"] = summarize(samples, time.perf_counter() - started)
+    results["xp_scorer"]["chars_per_message"] = round(sum(map(len, corpus)) / len(corpus), 1)
+
+    # The full on_message handler
+    log_in_stub_user(bot_module.bot)
+    rng = random.Random(seed)
+    authors = [StubMember(100000 + i) for i in range(users)]
+    stub_messages = [StubMessage(i, rng.choice(authors), content) for i, content in enumerate(corpus)]
+
+    async def drive():
+        samples = []
+        started = time.perf_counter()
+        for message in stub_messages:
+            t0 = time.perf_counter()
+            await bot_module.on_message(message)
+            samples.append(time.perf_counter() - t0)
+        await bot_module.flush_buffered_xp()  # Count the last partial batch too
+        return samples, time.perf_counter() - started
+
+    samples, elapsed = asyncio.get_event_loop().run_until_complete(drive())
+    results["on_message"] = summarize(samples, elapsed)
+    results["on_message"]["users"] = users
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    prepare_workdir()
+    report({"scoring": run(args.messages, args.users, args.seed)}, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# Shared plumbing for the benchmarks: an isolated working directory, stub
+# Discord objects, a synthetic message corpus and latency statistics.
+#
+# The bot's modules use relative paths (database.db, avatar_cache/, .env), so
+# prepare_workdir() must run before any of them is imported. Benchmarks never
+# touch the real database.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_FILES = ["TT Fors Trial Bold.ttf", "emoji_images", "role_images"]  # Linked into the work dir
+BENCH_BOT_USER_ID = 1  # ID of the stub bot user
+
+
+# Function to run the benchmarks in a scratch directory with a fresh database
+def prepare_workdir(path=None):
+    path = path or tempfile.mkdtemp(prefix="goku-bench-")
+    os.makedirs(path, exist_ok=True)
+    for name in SHARED_FILES:
+        source, target = os.path.join(REPO_ROOT, name), os.path.join(path, name)
+        if os.path.exists(source) and not os.path.exists(target):
+            os.symlink(source, target)
+    env_path = os.path.join(path, ".env")
+    if not os.path.exists(env_path):
+        with open(env_path, "w") as f:
+            f.write("DISCORD_TOKEN=benchmark\n")  # bot.py reads .env on import
+    os.chdir(path)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    return path
+
+
+# Stub Discord objects: just the attributes and coroutines the bot uses
+
+class StubAsset:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+
+class StubRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+
+
+class StubMember:
+    def __init__(self, user_id, name=None, nick=None, avatar=None, roles=(), bot=False, avatar_bytes=b""):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.nick = nick
+        self.display_name = nick or self.name
+        self.discriminator = f"{user_id % 10000:04d}"
+        self.avatar = avatar
+        self.roles = list(roles)
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+        self.avatar_bytes = avatar_bytes
+
+    def avatar_url_as(self, format=None, size=None):
+        return StubAsset(self.avatar_bytes)
+
+
+class StubGuild:
+    def __init__(self, guild_id, members=()):
+        self.id = guild_id
+        self.members = {member.id: member for member in members}
+
+    def get_member(self, user_id):
+        return self.members.get(int(user_id))
+
+    async def fetch_member(self, user_id):
+        return self.members[int(user_id)]
+
+    def get_role(self, role_id):
+        return None
+
+
+class StubChannel:
+    def __init__(self, channel_id, guild=None):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class StubMessage:
+    def __init__(self, message_id, author, content, guild=None, channel=None):
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.guild = guild
+        self.channel = channel or StubChannel(0, guild)
+        self.mentions = []
+        self.role_mentions = []
+        self.attachments = []
+        self.embeds = []
+        self._state = None  # commands.Context copies this; nothing reads it for plain chat
+
+
+# Function to make the commands extension treat the stub bot user as logged in
+def log_in_stub_user(bot):
+    bot._connection.user = StubMember(BENCH_BOT_USER_ID, name="goku", bot=True)
+
+
+# Function to build a small PNG, standing in for an avatar download
+def make_avatar_png(seed, size=64):
+    from PIL import Image
+    rng = random.Random(seed)
+    img = Image.new("RGB", (size, size), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+# Synthetic chat: short replies, longer messages, links, custom and unicode emoji
+WORDS = (
+    "the quick brown fox gg lol bruh anyone up for ranked tonight ngl that was insane nice ok ok "
+    "123 ez wait what happened yesterday honestly no way i think we should try again later"
+).split()
+UNICODE_EMOJI = ["😂", "🔥", "👍🏽", "👨‍💻", "🇺🇸", "1️⃣", "❤️", "✨", "🏴󠁧󠁢󠁳󠁣󠁴󠁿", "💀"]
+CUSTOM_EMOJI = ["<:grove_Street:1312395110570528828>", "<a:One:1310686608109862962>", "<a:x:123>"]
+LINKS = [
+    "https://discord.com/channels/1227505156220784692/1/2",
+    "https://tenor.com/view/cat-dance-gif-1234567",
+    "http://example.org/watch?v=abc&t=42",
+]
+MESSAGE_LENGTHS = [1, 2, 4, 8, 16, 40, 120]  # Words per message, mostly short like real chat
+
+
+# Function to generate one message's content
+def make_message_content(rng):
+    parts = []
+    for _ in range(rng.choice(MESSAGE_LENGTHS)):
+        roll = rng.random()
+        if roll < 0.8:
+            parts.append(rng.choice(WORDS))
+        elif roll < 0.9:
+            parts.append(rng.choice(UNICODE_EMOJI))
+        elif roll < 0.96:
+            parts.append(rng.choice(CUSTOM_EMOJI))
+        else:
+            parts.append(rng.choice(LINKS))
+    return rng.choice([" ", " ", " ", "\n"]).join(parts)
+
+
+# Function to generate a reproducible corpus of message contents
+def message_corpus(count, seed=0):
+    rng = random.Random(seed)
+    return [make_message_content(rng) for _ in range(count)]
+
+
+# Function to compute a nearest-rank percentile of sorted samples
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_samples))) - 1, 0)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+# Function to summarize per-operation timings (seconds) in milliseconds
+def summarize(samples, elapsed=None):
+    ordered = sorted(samples)
+    elapsed = sum(ordered) if elapsed is None else elapsed
+    return {
+        "count": len(ordered),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+
+
+# Function to describe where the numbers came from
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+# Function to print results and optionally write them to a JSON file (resolve a
+# relative output path before prepare_workdir changes the working directory)
+def report(results, output=None):
+    document = {"environment": environment(), "results": results}
+    text = json.dumps(document, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    return document
@@ -0,0 +1,167 @@
+"""
+Replay synthetic guild traffic against the bot, offline.
+
+Dispatches stub messages through bot.dispatch("message", ...), the same
+path a gateway MESSAGE_CREATE takes, at a fixed rate from a large pool of
+users. Records event-loop lag, XP flushes (DB commits) and rows written
+per second, and process memory, once a second and as a summary.
+
+    python benchmarks/load_generator.py --rate 500 --users 50000 --duration 60 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import time
+
+from harness import StubMember, StubMessage, log_in_stub_user, make_message_content, prepare_workdir, report, summarize
+
+LAG_SAMPLE_INTERVAL = 0.05  # Seconds between event-loop lag samples
+TICK = 0.01  # Messages are dispatched in bursts this far apart
+
+
+# Function to get the process's resident memory in MiB
+def rss_mib():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak, in KiB on Linux
+
+
+class CommitCounter:
+    """Wraps a db_server write function and counts the batches and rows it writes."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.__name__ = fn.__name__  # db_executor labels its metrics with the function name
+        self.commits = 0
+        self.rows = 0
+
+    def __call__(self, batch, clan_batch=None):
+        ok = self.fn(batch, clan_batch)
+        if ok and batch:
+            self.commits += 1
+            self.rows += len(batch)
+        return ok
+
+
+def run(rate=500, users=50000, duration=60, seed=0):
+    import bot as bot_module
+    from leaderboard_index import xp_index
+
+    rng = random.Random(seed)
+    bot = bot_module.bot
+    log_in_stub_user(bot)
+    authors = [StubMember(300000 + i) for i in range(users)]
+    counter = CommitCounter(bot_module.write_xp_batch)
+    bot_module.write_xp_batch = counter  # flush_buffered_xp looks the name up in bot's globals
+
+    lag_samples = []
+    timeline = []
+    state = {"running": True, "dispatched": 0}
+
+    async def sample_lag():
+        while state["running"]:
+            expected = time.perf_counter() + LAG_SAMPLE_INTERVAL
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            lag_samples.append(max(time.perf_counter() - expected, 0.0))
+
+    async def sample_every_second(started):
+        last_commits, last_rows, last_dispatched = 0, 0, 0
+        while state["running"]:
+            await asyncio.sleep(1)
+            lag_window = lag_samples[-int(1 / LAG_SAMPLE_INTERVAL):]
+            timeline.append({
+                "t": round(time.perf_counter() - started, 1),
+                "messages": state["dispatched"] - last_dispatched,
+                "commits": counter.commits - last_commits,
+                "rows_written": counter.rows - last_rows,
+                "max_lag_ms": round(max(lag_window, default=0) * 1000, 2),
+                "rss_mib": round(rss_mib(), 1),
+                "ranked_users": len(xp_index),
+                "tasks": len(asyncio.all_tasks()),
+            })
+            last_commits, last_rows, last_dispatched = counter.commits, counter.rows, state["dispatched"]
+
+    async def generate(started):
+        per_tick = rate * TICK
+        owed = 0.0
+        next_tick = started
+        while time.perf_counter() - started < duration:
+            owed += per_tick
+            while owed >= 1:
+                owed -= 1
+                state["dispatched"] += 1
+                message = StubMessage(state["dispatched"], rng.choice(authors), make_message_content(rng))
+                bot.dispatch("message", message)
+            next_tick += TICK
+            await asyncio.sleep(max(next_tick - time.perf_counter(), 0))
+
+    async def drive():
+        rss_start = rss_mib()
+        started = time.perf_counter()
+        samplers = [asyncio.ensure_future(sample_lag()), asyncio.ensure_future(sample_every_second(started))]
+        bot_module.flush_xp.start()  # The timed flush on_ready starts in production
+        await generate(started)
+        bot_module.flush_xp.cancel()
+        elapsed = time.perf_counter() - started
+
+        # Let the dispatched handlers finish, then flush what is still buffered
+        drain_started = time.perf_counter()
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task() and task not in samplers]
+        pending = [task for task in pending if not task.done()]
+        await asyncio.gather(*pending, return_exceptions=True)
+        await bot_module.flush_buffered_xp()
+        drain = time.perf_counter() - drain_started
+
+        state["running"] = False
+        await asyncio.gather(*samplers)
+        return elapsed, drain, rss_start, rss_mib()
+
+    elapsed, drain, rss_start, rss_end = asyncio.get_event_loop().run_until_complete(drive())
+    bot_module.write_xp_batch = counter.fn
+    loop_lag = summarize(lag_samples)
+    del loop_lag["ops_per_sec"]  # Samples are taken on a timer, not per operation
+
+    return {
+        "target_rate": rate,
+        "achieved_rate": round(state["dispatched"] / elapsed, 1),
+        "messages": state["dispatched"],
+        "users": users,
+        "ranked_users": len(xp_index),
+        "duration_s": round(elapsed, 2),
+        "drain_s": round(drain, 3),
+        "loop_lag": loop_lag,
+        "db": {
+            "commits": counter.commits,
+            "commits_per_sec": round(counter.commits / elapsed, 2),
+            "rows_written": counter.rows,
+            "rows_per_sec": round(counter.rows / elapsed, 1),
+        },
+        "memory": {
+            "rss_start_mib": round(rss_start, 1),
+            "rss_end_mib": round(rss_end, 1),
+            "growth_mib": round(rss_end - rss_start, 1),
+        },
+        "timeline": timeline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=int, default=500, help="Messages per second")
+    parser.add_argument("--users", type=int, default=50000, help="Distinct message authors")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of traffic")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    prepare_workdir()
+    report({"load": run(args.rate, args.users, args.duration, args.seed)}, output)
+
+
+if __name__ == "__main__":
+    main()
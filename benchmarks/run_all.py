@@ -0,0 +1,38 @@
+"""
+Run every benchmark and write one JSON report.
+
+Everything runs offline against stub Discord objects and a scratch
+database. Compare the JSON from two commits to spot regressions in the
+XP write path and the leaderboard renderer.
+
+    python benchmarks/run_all.py --output bench.json
+    python benchmarks/run_all.py --quick
+"""
+import argparse
+import os
+
+import bench_db
+import bench_render
+import bench_scoring
+from harness import prepare_workdir, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="Smaller runs, for a smoke test")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    scale = 10 if args.quick else 1
+
+    prepare_workdir()
+    results = {
+        "scoring": bench_scoring.run(messages=20000 // scale),
+        "db": bench_db.run(writes=5000 // scale, batches=50 // scale),
+        "render": bench_render.run(iterations=50 // scale),
+    }
+    report(results, output)
+
+
+if __name__ == "__main__":
+    main()
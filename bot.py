@@ -1,29 +1,47 @@
 import discord
 from discord.ext import commands, tasks
+from discord.http import Route
 import logging
 import asyncio
 from datetime import datetime, timedelta
 import time
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import requests
 from io import BytesIO
 import os
-import re
-import emoji
 from typing import List, Dict
-import sqlite3
 import signal
 import sys
 import traceback
+import hashlib
+from db_server import (
+    XP_FLUSH_INTERVAL, queue_user_xp, take_pending_xp, restore_pending_xp, discard_user_xp, begin_xp_reset, finish_xp_reset,
+    RESET_DONE, RESET_FAILED, write_xp_batch, delete_user_data, reset_user_xp, reset_clan_tables, pending_xp_users,
+)
+from db_executor import db
+from xp_scorer import xp_scorer
+from leaderboard_index import xp_index
+from leaderboard_publisher import LeaderboardPublisher
+from member_cache import member_cache
+from avatar_cache import avatar_cache, avatar_key, AVATAR_FETCH_SIZE
+from leaderboard_render import render_leaderboard
+from render_cache import render_cache, leaderboard_model_key
+from render_resources import FONT_PATH, warm_up as warm_up_render_resources
+from metrics import (
+    metrics, timed_handler, sample_loop_lag, install_rate_limit_counter, start_metrics_server,
+    COMMAND_SECONDS, RENDER_SECONDS, DISCORD_RATE_LIMITS,
+)
+import profiling
+from profiling import profiled, profile_for, profile_call, startup_window, PROFILE_WINDOW, PROFILE_MAX_WINDOW
+from scheduler import scheduler
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Constants
 RESET_INTERVAL = timedelta(weeks=1)  # 1 week interval
 D_RESET_INTERVAL = timedelta(days=1)
-LAST_RESET_TIME_FILE = "last_reset_time.txt"  # File to track last reset time
+# Last reset times from before the scheduled_jobs table; only read to seed it
+LAST_RESET_TIME_FILE = "last_reset_time.txt"
 D_LAST_RESET_TIME_FILE = "daily_last_reset_time.txt"
-conn = sqlite3.connect('database.db', check_same_thread=False)
-cursor = conn.cursor()
-reset_task_running = False  # Global variable to track task status
 ROLE_IMAGES_FOLDER = "./role_images"  # Path to your folder containing images
 
 # Logging setup
@@ -33,9 +51,19 @@ logger = logging.getLogger(__name__)
 # Channel IDs
 ROLE_LOG_CHANNEL_ID = 1251143629943345204
 LEADERBOARD_CHANNEL_ID = 1303672077068537916
+LEADERBOARD_TITLE = "🏆  Yappers of the day!"
+LEADERBOARD_HISTORY_LIMIT = 50  # Recent messages searched for our previous leaderboard on startup
+RANK_NEIGHBOURS = 2  # Places shown above and below the member in !rank
+LEADERBOARD_RETRY_AFTER = 5  # Seconds to back off after a 429 that has no usable Retry-After header
 GUILD_ID = 1227505156220784692  # Replace with your actual guild ID
-CLAN_ROLE_1_ID = 1245407423917854754  # Replace with your actual Clan Role 1 ID
-CLAN_ROLE_2_ID = 1247225208700665856
+# Clan roles; a clan's XP is stored under its role ID, so adding a clan is one more ID here
+CLAN_ROLE_IDS = [
+    1245407423917854754,
+    1247225208700665856,
+]
+CLAN_ROLES = frozenset(CLAN_ROLE_IDS)  # For membership checks against a member's roles
+CLAN_EMOJIS = {1245407423917854754: "<:grove_Street:1312395110570528828>"}  # Shown next to the clan's role
+CLAN_LEADERBOARD_SIZE = 20  # Clans listed by !clans
 
 # Define intents
 intents = discord.Intents.default()
@@ -44,16 +72,21 @@ intents.members = True
 # Bot setup
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Regular expressions
-URL_REGEX = r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-
-previous_top_10 = []  # Cache for storing the previous top 10 users
 leaderboard_message = None
-cached_top_users = []  # Cache for the last updated top 10 users
-cached_image_path = "leaderboard.png"  
 
-# Define FONT_PATH globally
-FONT_PATH = "TT Fors Trial Bold.ttf"  # Adjust the path as needed
+# Leaderboard images are drawn in a worker process so Pillow never blocks the event loop
+RENDER_WORKERS = 1  # A single long-lived worker keeps its fonts and caches warm
+render_pool = None
+metrics_runner = None  # Local Prometheus endpoint, started in on_ready (see metrics.py)
+loop_lag_task = None
+profile_on_start = startup_window()  # GOKU_PROFILE=<seconds> profiles the first minutes after login
+
+# Count discord.py's 429 retries, and report these gauges on every scrape
+install_rate_limit_counter()
+metrics.gauge_callback("goku_ranked_users", "Users in the in-memory XP ranking", lambda: len(xp_index))
+metrics.gauge_callback("goku_pending_xp_users", "Users with XP waiting for the next flush", pending_xp_users)
+metrics.gauge_callback("goku_member_cache_hit_rate", "Member lookups served without REST", lambda: member_cache.stats()["hit_rate"])
+metrics.gauge_callback("goku_render_cache_hit_rate", "Leaderboard images served without a new render", lambda: render_cache.stats()["hit_rate"])
 
 # Function to load variables from a .env file
 def load_env(filename='.env'):
@@ -73,13 +106,23 @@ async def graceful_shutdown():
     logger.info("Shutting down bot gracefully...")
     try:
         # Stop tasks
-        reset_weekly.stop()
-        reset_task_running = False
+        scheduler.stop()
+        flush_xp.stop()
+        leaderboard_publisher.stop()
 
-        # Close database connection
-        conn.close()
+        # Write any buffered XP, then let the DB threads finish and close
+        await flush_buffered_xp()
+        db.shutdown()
         logger.info("Database connection closed.")
 
+        # Stop the render worker so it doesn't outlive a restart
+        if render_pool:
+            render_pool.shutdown(wait=True)
+
+        # Free the metrics port for the restarted process
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
         # Cancel all running tasks
         tasks = asyncio.all_tasks()
         for task in tasks:
@@ -94,29 +137,13 @@ async def graceful_shutdown():
 
 @tasks.loop(minutes=15)
 async def reconnect_bot():
-    global leaderboard_message  # Ensure this is declared as global if you're modifying it inside the function.
-
     try:
         
         # Wait for 15 minutes before disconnecting
         logger.info("Bot will stay active for 15 minutes before disconnecting.")
         await asyncio.sleep(15 * 60)  # 15 minutes in seconds
-        
-        # Fetch the channel and embed data (assuming this is where the image and embed come from)
-        channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)  # Replace with your actual channel ID
-        if not channel:
-            logger.error(f"Leaderboard channel not found: {LEADERBOARD_CHANNEL_ID}")
-            return
-
-        if leaderboard_message:
-            try:
-                # Delete the previous message if it exists
-                await leaderboard_message.delete()
-                logger.info("Deleted previous leaderboard message before reconnecting.")
-            except discord.NotFound:
-                logger.info("Leaderboard message not found to delete.")
-            except discord.HTTPException as e:
-                logger.error(f"Failed to delete leaderboard message: {e}")
+
+        # The leaderboard message is left in place; the restarted bot finds and edits it
 
         # Disconnect the bot
         logger.info("Disconnecting bot for scheduled reconnect...")
@@ -124,7 +151,7 @@ async def reconnect_bot():
 
         await graceful_shutdown()  # Clean up tasks and resources
 
-        # Restart the process
+        # Restart the process (the reset schedule lives in the database, so it carries over)
         logger.info(f"Restarting bot with: {sys.executable} {sys.argv}")
         os.execv(sys.executable, ['python3'] + sys.argv)  # Restart the script
 
@@ -136,27 +163,40 @@ async def reconnect_bot():
 
 @bot.event
 async def on_ready():
-    global reset_task_running
+    global metrics_runner, loop_lag_task, profile_on_start
 
     try:
         logger.info(f"Bot logged in as {bot.user.name}")
 
-        # Ensure the reset task is scheduled properly
-        if not reset_task_running:
-            reset_task_running = True
-            bot.loop.create_task(reset_task())  # Start reset_task in the background
+        # Metrics: event-loop lag sampling and the local /metrics endpoint
+        if loop_lag_task is None:
+            loop_lag_task = bot.loop.create_task(sample_loop_lag())
+        if metrics_runner is None:
+            metrics_runner = await start_metrics_server()
 
-        # Start the weekly reset task (ensure it's running)
-        if not reset_weekly.is_running():
-            reset_weekly.start()  # Start the looped weekly task
+        # Opt-in profiling window requested through the environment
+        if profile_on_start:
+            bot.loop.create_task(profile_for(profile_on_start))
+            profile_on_start = 0
+
+        # Start the daily and weekly resets (their schedule is kept in the database)
+        scheduler.start()
+
+        # Load fonts, sprites and the emoji atlas in the render worker ahead of the first render
+        if render_pool is None:
+            bot.loop.create_task(run_render(warm_up_render_resources))
+
+        # Start the write-behind XP flush task
+        if not flush_xp.is_running():
+            flush_xp.start()
 
         # Ensure the reconnect bot task is running
         if not reconnect_bot.is_running():
             logger.info("Starting reconnect_bot task.")
             reconnect_bot.start()
               
-        # Call the leaderboard update function
-        update_leaderboard.start()
+        # Publish the leaderboard now, then whenever the top 10 changes
+        leaderboard_publisher.start()
         
     except Exception as e:
         logger.error(f"Error in on_ready: {e}")
@@ -169,264 +209,75 @@ async def on_disconnect():
 async def on_error(event, *args, **kwargs):
     logger.error(f"An error occurred: {event}, {args}, {kwargs}")
 
-def d_check_file_contents():
-    if os.path.exists(D_LAST_RESET_TIME_FILE):
-        with open(D_LAST_RESET_TIME_FILE, "r") as file:
-            content = file.read()
-            logger.info(f"Contents of the reset time file: {content}")
-    else:
-        logger.info(f"{D_LAST_RESET_TIME_FILE} does not exist.")
-
-# Function to check contents of the file
-def check_file_contents():
-    if os.path.exists(LAST_RESET_TIME_FILE):
-        with open(LAST_RESET_TIME_FILE, "r") as file:
-            content = file.read()
-            logger.info(f"Contents of the reset time file: {content}")
-    else:
-        logger.info(f"{LAST_RESET_TIME_FILE} does not exist.")
-
-# Function to read the last reset time from the file
-def read_last_reset_time():
+# Function to reset the database (clear all XP data), recording the scheduler run in the same transaction
+async def reset_database(run=None):
+    # Start tracking the XP that survives the DELETE in the same step as queueing it
+    begin_xp_reset()
+    done = db.submit_write(reset_user_xp, run)
     try:
-        if not os.path.exists(LAST_RESET_TIME_FILE):
-            # If the file doesn't exist, initialize it with the current time
-            write_last_reset_time()
-            return datetime.now()  # Return the current time as the last reset time
-
-        with open(LAST_RESET_TIME_FILE, "r") as file:
-            # Read and strip the content to handle any unwanted extra spaces or empty lines
-            content = file.read().strip()
-
-            if not content:  # If the file is empty
-                logger.info("The reset file is empty, writing current time.")
-                write_last_reset_time()  # Write current time as last reset time
-                return datetime.now()  # Return the current time
-
-            try:
-                # Try to parse the content as a datetime
-                return datetime.fromisoformat(content)  # Read last reset time
-            except ValueError as e:
-                logger.error(f"Invalid datetime format in file: {e}")
-                write_last_reset_time()  # Write current time as last reset time
-                return datetime.now()  # Return current time
-
-    except Exception as e:
-        # Log the error and return current time as fallback
-        logger.error(f"Error reading last reset time: {e}")
-        write_last_reset_time()  # Write current time as last reset time in case of error
-        return datetime.now()  # Return current time
+        status = await asyncio.wrap_future(done)
+    except BaseException:
+        finish_xp_reset(RESET_FAILED)
+        raise
+    # The ranking only restarts once the DELETE has committed (nothing awaited in between)
+    finish_xp_reset(status)
+    if status == RESET_FAILED:
+        raise RuntimeError("Daily reset failed and was rolled back; user_xp still holds the old XP.")
 
-# Function to read the last reset time from the file
-def d_read_last_reset_time():
-    try:
-        if not os.path.exists(D_LAST_RESET_TIME_FILE):
-            # If the file doesn't exist, initialize it with the current time
-            d_write_last_reset_time()
-            return datetime.now()  # Return the current time as the last reset time
-
-        with open(D_LAST_RESET_TIME_FILE, "r") as file:
-            # Read and strip the content to handle any unwanted extra spaces or empty lines
-            content = file.read().strip()
-
-            if not content:  # If the file is empty
-                logger.info("The reset file is empty, writing current time.")
-                d_write_last_reset_time()  # Write current time as last reset time
-                return datetime.now()  # Return the current time
-
-            try:
-                # Try to parse the content as a datetime
-                return datetime.fromisoformat(content)  # Read last reset time
-            except ValueError as e:
-                logger.error(f"Invalid datetime format in file: {e}")
-                d_write_last_reset_time()  # Write current time as last reset time
-                return datetime.now()  # Return current time
 
-    except Exception as e:
-        # Log the error and return current time as fallback
-        logger.error(f"Error reading last reset time: {e}")
-        d_write_last_reset_time()  # Write current time as last reset time in case of error
-        return datetime.now()  # Return current time
-      
-# Function to write the last reset time to the file
-def write_last_reset_time():
-    try:
-        with open(LAST_RESET_TIME_FILE, "w") as file:
-            current_time = datetime.now().isoformat()  # Get current time as ISO 8601 format
-            file.write(current_time)  # Store current time as last reset time
-            logger.info(f"Last reset time written to file: {current_time}")
-    except Exception as e:
-        logger.error(f"Error writing last reset time: {e}")
-
-def d_write_last_reset_time():
-    try:
-        with open(D_LAST_RESET_TIME_FILE, "w") as file:
-            current_time = datetime.now().isoformat()
-            file.write(current_time)
-            logger.info(f"Successfully wrote to {D_LAST_RESET_TIME_FILE}: {current_time}")
-    except Exception as e:
-        logger.error(f"Failed to write to {D_LAST_RESET_TIME_FILE}: {e}")
-        raise  # Re-raise to highlight the error
-
-
-# Function to calculate the remaining time before the next reset
-def d_time_remaining_until_reset():
-    d_last_reset_time = d_read_last_reset_time()
-    if d_last_reset_time is None:
-        return D_RESET_INTERVAL  # No last reset time, return 1 week interval
-    d_next_reset_time = d_last_reset_time + D_RESET_INTERVAL
-    d_remaining_time = d_next_reset_time - datetime.now()
-    return d_remaining_time if d_remaining_time > timedelta(0) else timedelta(0)  # Return remaining time or 0 if reset is overdue
-
-# Function to calculate the remaining time before the next reset
-def time_remaining_until_reset():
-    last_reset_time = read_last_reset_time()
-    if last_reset_time is None:
-        return RESET_INTERVAL  # No last reset time, return 1 week interval
-    next_reset_time = last_reset_time + RESET_INTERVAL
-    remaining_time = next_reset_time - datetime.now()
-    return remaining_time if remaining_time > timedelta(0) else timedelta(0)  # Return remaining time or 0 if reset is overdue
-
-# Function to reset the database (clear all XP data)
-async def reset_database():
-    try:
-        cursor.execute("BEGIN TRANSACTION;")
-        cursor.execute("DELETE FROM user_xp;")  # Clears all XP data
-        conn.commit()
-        print("Database has been reset.")
-    except sqlite3.Error as e:
-        conn.rollback()
-        print(f"Error resetting the database: {e}")
-        with open("error_log.txt", "a") as log_file:
-            log_file.write(f"Error resetting the database: {e}\n")
-            
-async def reset_task():
-    global reset_task_running
-    try:
-        while True:
-            d_remaining_time = d_time_remaining_until_reset()
-            logger.info(f"Daily time remaining: {d_remaining_time}")
-
-            if d_remaining_time.total_seconds() > 0:
-                await asyncio.sleep(d_remaining_time.total_seconds())
-
-            # Perform daily reset and log success
-            await reset_and_save_top_users()
-            d_write_last_reset_time()
-            logger.info("Daily reset completed.")
-    except asyncio.CancelledError:
-        logger.info("reset_task was cancelled.")
-        raise  # Allow the cancellation to propagate
-    except Exception as e:
-        logger.error(f"Error in reset_task: {e}")
-    finally:
-        reset_task_running = False
-    
-# Function to reset the database and perform the save operation
-async def reset_and_save_top_users():
-    # Fetch top 10 users with their XP
-    top_users = await fetch_top_10_users_and_check_roles(bot, CLAN_ROLE_1_ID, CLAN_ROLE_2_ID)
-
-    # Save each user's XP before resetting the database
-    for user in top_users:
-        user_id = user['user_id']
-        xp = user['xp']
-        await save_user_to_clan_role_table(bot, user_id, xp)  # Save the top 10 users' XP before reset
+# Function to reset the daily XP (a scheduler job); clan XP was credited as it was earned and is kept
+@profiled
+async def reset_daily_xp(run=None):
+    # Make sure buffered XP (and the clan XP that came with it) is written first
+    await flush_buffered_xp()
 
     # Now reset the database
-    await reset_database()
-    print("XP data reset and top users saved.")
-
-# Function to reset clan XP tables for both clans
-async def reset_clan_xp():
-    try:
-        # Reset XP for both clans
-        cursor.execute("DELETE FROM clan_role_1")  # Reset table for Clan 1
-        cursor.execute("DELETE FROM clan_role_2")  # Reset table for Clan 2
-        conn.commit()
-        print("Clan XP tables have been reset.")
-    except sqlite3.Error as e:
-        print(f"Error resetting clan XP tables: {e}")
-        with open("error_log.txt", "a") as log_file:
-            log_file.write(f"Error resetting clan XP tables: {e}\n")
-            
-# Function to count custom emojis in a message
-def count_custom_emojis(content):
-    custom_emoji_pattern = r'<a?:\w+:\d+>'
-    return len(re.findall(custom_emoji_pattern, content))
+    await reset_database(run)
+    logger.info("Daily XP reset.")
 
-# Function to determine if a character is an emoji
-def is_emoji(char):
-    return emoji.is_emoji(char)
 
 # Bot event for incoming messages
 @bot.event
+@timed_handler
+@profiled
 async def on_message(message):
     if message.author.bot:
         return
 
     user_id = message.author.id
 
-    # Remove URLs and non-alphanumeric characters except spaces
-    filtered_content = re.sub(URL_REGEX, "", message.content)
-    filtered_content = ''.join(c for c in filtered_content if c.isalnum() or c.isspace())
+    # XP Calculation: 1 XP per alphanumeric character, 5 XP per emoji (see xp_scorer.DEFAULT_XP_RULES)
+    total_xp = xp_scorer.score(message.content)
 
-    # XP Calculation
-    character_xp = len(filtered_content.replace(" ", "")) * 1  # 1 XP per alphanumeric character
-    custom_emoji_count = count_custom_emojis(message.content)
-    unicode_emoji_count = sum(1 for c in message.content if is_emoji(c))
-    emoji_xp = (custom_emoji_count + unicode_emoji_count) * 5  # 5 XP per emoji
-    total_xp = character_xp + emoji_xp
+    # The author's clan, from the roles already on the cached member (no API call)
+    clan_id = clan_of(message.author)
 
-    # Update user data
-    from db_server import update_user_xp
-    update_user_xp(user_id, total_xp)
+    # Buffer the XP, for the user and their clan; it is written in batches by flush_xp
+    if queue_user_xp(user_id, total_xp, clan_id):
+        await flush_buffered_xp()
 
     await bot.process_commands(message)
 
-# Function to create a rounded mask for profile pictures
-def create_rounded_mask(size, radius=10):  # Reduced the radius to 10 for less rounding
-    mask = Image.new('L', size, 0)  # 'L' mode creates a grayscale image
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), size], radius=radius, fill=255)  # Adjusted radius
-    return mask
-
-
-# Function to round the corners of a profile picture
-def round_pfp(img_pfp):
-    # Ensure the image is in RGBA mode to support transparency
-    img_pfp = img_pfp.convert('RGBA')
-    
-    # Create a rounded mask with the size of the image
-    mask = create_rounded_mask(img_pfp.size)
-    
-    img_pfp.putalpha(mask)  # Apply the rounded mask as alpha (transparency)
-    return img_pfp
-  
-# Cache for storing the previous top 10 users with more details (ID, XP, avatar URL, nickname)
-previous_top_10 = []  # A list of dictionaries to store user data
-
 # Modify the update function to save more information
 async def fetch_top_users_with_xp() -> List[Dict]:
     """
-    Fetches the top 10 users based on XP from the database.
-    Returns a list of dictionaries containing user data (ID, XP, nickname, avatar URL).
+    Fetches the top 10 users based on XP from the in-memory ranking.
+    Returns a list of dictionaries containing user data (ID, XP, nickname, avatar URL, avatar key).
     """
-    
-    cursor.execute("SELECT user_id, xp FROM user_xp ORDER BY xp DESC LIMIT 10")
-    top_users_data = cursor.fetchall()
+    top_users_data = xp_index.top(10)
 
     # Create a list of dictionaries with user details (ID, XP, nickname, avatar URL)
     users_with_details = []
     for user_id, xp in top_users_data:
         member = await get_member(user_id)
         if member:
-            nickname, avatar_url = member
+            nickname, avatar_url, avatar_hash = member
             users_with_details.append({
                 'user_id': user_id,
                 'xp': xp,
                 'nickname': nickname,
-                'avatar_url': avatar_url
+                'avatar_url': avatar_url,
+                'avatar_key': avatar_hash
             })
     return users_with_details
   
@@ -445,278 +296,94 @@ def download_font():
         else:
             logging.error("Failed to download font. Using default font instead.")
             
+# The render worker loads the font once, so fetch it before the first render
+download_font()
+
 # Function to fetch member details
 async def get_member(user_id):
     try:
-        from db_server import delete_user_data
         guild = bot.get_guild(GUILD_ID)
         if not guild:
             logger.error(f"Guild with ID {GUILD_ID} not found")
             return None
 
-        member = await guild.fetch_member(user_id)
+        # Gateway cache first, then the local TTL cache, REST only on a miss
+        member = await member_cache.get(guild, user_id)
         if member:
             nickname = member.nick if member.nick else member.name
-            avatar_url = member.avatar_url if member.avatar_url else None
-            return nickname, avatar_url
+            avatar_url = member.avatar_url_as(format="png", size=AVATAR_FETCH_SIZE)
+            return nickname, avatar_url, avatar_key(member)
         else:
             # If member is not found (i.e., they left the server), clean up the data
-            delete_user_data(user_id)  # Clean up the data from the database
+            discard_user_xp(user_id)
+            await db.write(delete_user_data, user_id)  # Clean up the data from the database
             return None
     except discord.HTTPException as e:
         # Handle HTTP exceptions (e.g., member not found)
         if e.code == 10007:  # Member not found
-            delete_user_data(user_id)
+            discard_user_xp(user_id)
+            await db.write(delete_user_data, user_id)
             return None
         else:
             logger.error(f"Failed to fetch member {user_id} in guild {GUILD_ID}: {e}")
             return None
           
-# Directory where emoji images are stored
-EMOJI_DIR = "./emoji_images/"  # Update this to the correct path where emojis are saved
-
-# Ensure the emoji directory exists
-if not os.path.exists(EMOJI_DIR):
-    os.makedirs(EMOJI_DIR)
-
-def fetch_emoji_image(emoji_char):
-    emoji_unicode = format(ord(emoji_char), 'x')
-    emoji_filename = f"{emoji_unicode}.png"
-    emoji_image_path = os.path.join(EMOJI_DIR, emoji_filename)
-
-    if os.path.exists(emoji_image_path):
-        try:
-            img = Image.open(emoji_image_path).convert("RGBA")
-            # Remove or comment the print statement below
-            # print(f"Loaded emoji image: {emoji_image_path}")
-            return img
-        except Exception as e:
-            logging.error(f"Failed to open image for emoji {emoji_char}: {e}")
-            return None
-    else:
-        logging.warning(f"Emoji image not found for {emoji_char} at {emoji_image_path}")
-        return None
-
-def render_nickname_with_emoji_images(draw, img, nickname, position, font, emoji_size=28, emoji_offset=5):
-    """
-    Renders the nickname with emojis, where emojis are slightly offset down from the text.
-    
-    :param draw: ImageDraw object to draw text and emojis
-    :param img: Image object where the nickname and emojis will be rendered
-    :param nickname: The string nickname with embedded emojis
-    :param position: The (x, y) position where the text should start
-    :param font: The font to use for rendering the text
-    :param emoji_size: The size of the emoji to render
-    :param emoji_offset: The vertical offset to move the emojis down (default 5 pixels)
-    """
-
-    # Split the nickname into text and emoji parts
-    text_part = ''.join([char for char in nickname if not emoji.is_emoji(char)])
-    emoji_part = ''.join([char for char in nickname if emoji.is_emoji(char)])
-
-    # Increase outline thickness for better visibility
-    stroke_width = 2  # Increased stroke width for thicker outline
-
-    # Draw regular text first with outline
-    draw.text(position, text_part, font=font, fill="white", stroke_width=stroke_width, stroke_fill="black")
-
-    # Get the bounding box of the regular text to position the emojis correctly
-    text_bbox = draw.textbbox((0, 0), text_part, font=font)
-    text_width = text_bbox[2] - text_bbox[0]  # Width of the regular text part
-
-    # Adjust the position to draw emojis after the regular text
-    emoji_position = (position[0] + text_width + 5, position[1] + emoji_offset)  # Adjust y position by emoji_offset
-
-    # Loop through each character in the emoji part and render it as an image
-    for char in emoji_part:
-        if emoji.is_emoji(char):  # Ensure it's an emoji
-
-            emoji_img = fetch_emoji_image(char)  # Fetch the emoji image from local folder
-
-            if emoji_img:
-                emoji_img = emoji_img.resize((emoji_size, emoji_size))  # Resize to fit the text
-
-                # Paste the emoji image (uses transparency properly)
-                img.paste(emoji_img, emoji_position, emoji_img.convert('RGBA'))  # Use alpha channel for transparency
-
-                # Update position for the next emoji
-                emoji_position = (emoji_position[0] + emoji_size + 5, emoji_position[1])
-
-                
 def format_points(points):
     if points >= 1000:
         return f"{points / 1000:.1f}k"  # Formats as 'X.Xk'
     return str(points)
   
-@bot.event
-async def on_member_update(before, after):
-    # If nickname or avatar changed, update the cache
-    if before.nick != after.nick or before.avatar_url != after.avatar_url:
-        user_id = after.id
-        nickname = after.nick if after.nick else after.name
-        avatar_url = after.avatar_url if after.avatar_url else None
-        
-        # Update profile in the cache
-        updated = False
-        for i, (uid, xp, av_url, _) in enumerate(previous_top_10):
-            if uid == user_id:
-                previous_top_10[i] = (uid, xp, avatar_url, nickname)  # Update profile info
-                updated = True
-                break
-        
-        # If the user isn't in the cached list, add them
-        if not updated:
-            previous_top_10.append((user_id, 0, avatar_url, nickname))  # Initialize with 0 XP
-
-async def create_leaderboard_image():
-    # Download the font if it's not already cached
-    download_font()
-
-    WIDTH = 800  # Image width
-    HEIGHT = 600  # Image height
-    PADDING = 10  # Padding for layout
-
-    img = Image.new("RGBA", (WIDTH, HEIGHT), color=(0, 0, 0, 0))  # Transparent background (alpha=0)
-    draw = ImageDraw.Draw(img)
-
+# Function to run a render function in the render worker process
+async def run_render(fn, *args):
+    global render_pool
+    if render_pool is None:
+        render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    loop = asyncio.get_event_loop()
+    if profiling.session:
+        # Profile the call inside the worker, where the Pillow work happens
+        fn, args = profile_call, (profiling.session.render_profile_path, fn) + args
     try:
-        # Load the font from the local cache
-        font = ImageFont.truetype(FONT_PATH, size=28)
-    except IOError:
-        logging.error("Failed to load custom font. Using default font instead.")
-        font = ImageFont.load_default()  # Fallback to default font
-
-    # Rank-specific background colors
-    rank_colors = {
-        1: "#FFD700",  # Gold for Rank 1
-        2: "#E6E8FA",  # Silver for Rank 2
-        3: "#CD7F32",  # Bronze for Rank 3
-    }
-
-    y_position = PADDING
-    top_users = await fetch_top_users_with_xp()  # Example function to fetch users
-
-    if not top_users:
-        # If no users fetched, display a message
-        draw.text((PADDING, PADDING), "Bruh sadly No-one is yapping right now...", font=font, fill="white")
-    else:
-        for rank, user in enumerate(top_users, 1):
-            user_id = user['user_id']
-            xp = user['xp']
-            avatar_url = user['avatar_url']
-            nickname = user['nickname']
-
-            # Set background color based on rank
-            rank_bg_color = rank_colors.get(rank, "#36393e")
-
-            # Draw the rounded rectangle for the rank
-            draw.rounded_rectangle(
-                [(PADDING, y_position), (WIDTH - PADDING, y_position + 57)],
-                radius=10,  # Adjust radius for corner rounding
-                fill=rank_bg_color
-            )
-
-            # Fetch user profile picture
-            try:
-                response = requests.get(avatar_url)
-                img_pfp = Image.open(BytesIO(response.content))
-                img_pfp = img_pfp.resize((57, 58))  # Resize PFP to 57x58
-                img_pfp = round_pfp(img_pfp)  # Apply rounded corners to the PFP
-            except Exception as e:
-                logging.error(f"Failed to fetch avatar for user {user_id}: {e}")
-                img_pfp = Image.new('RGBA', (57, 57), color=(128, 128, 128, 255))  # Default grey circle
-
-            img.paste(img_pfp, (PADDING, y_position), img_pfp)  # Use the alpha mask when pasting
-
-            # Render rank text
-            rank_text = f"#{rank}"
-            rank_bbox = draw.textbbox((0, 0), rank_text, font=font)
-            rank_height = rank_bbox[3] - rank_bbox[1]  # Height of rank text
-            rank_y_position = y_position + (57 - rank_height) // 2 - 8  # Slightly move text upwards (adjust -8 value)
-            stroke_width = 2  # Increase the outline width here
-            draw.text((PADDING + 65, rank_y_position), rank_text, font=font, fill="white", stroke_width=stroke_width, stroke_fill="black")
-
-            # Calculate width for separators and nickname
-            rank_width = rank_bbox[2] - rank_bbox[0]
-
-            # Slightly decrease the gap between rank number and the first separator
-            first_separator_position = PADDING + 65 + rank_width + 10  # Decreased gap by changing +15 to +10
-
-            # Render the first "|" separator with outline
-            first_separator_text = "|"
-            first_separator_y_position = rank_y_position
-            outline_width = 2
-            outline_color = "black"
-            for x_offset in range(-outline_width, outline_width + 1):
-                for y_offset in range(-outline_width, outline_width + 1):
-                    draw.text((first_separator_position + x_offset, first_separator_y_position + y_offset),
-                              first_separator_text, font=font, fill=outline_color)
-            draw.text((first_separator_position, first_separator_y_position), first_separator_text, font=font, fill="white")
-
-            # Render the nickname with emojis
-            nickname_bbox = draw.textbbox((0, 0), nickname, font=font)
-            nickname_y_position = y_position + (57 - (nickname_bbox[3] - nickname_bbox[1])) // 2 - 8  # Slightly move nickname text upwards
-            render_nickname_with_emoji_images(draw, img, nickname, (first_separator_position + 20, nickname_y_position), font)
-
-            # Calculate space between nickname and second separator, taking emojis into account
-            nickname_width = nickname_bbox[2] - nickname_bbox[0]  # Get width of nickname text
-            emoji_gap = 12  # Extra space if there are emojis
-            second_separator_position = first_separator_position + 20 + nickname_width + emoji_gap  # Add space between nickname and second separator
-
-            # Render the second "|" separator with outline
-            second_separator_y_position = nickname_y_position
-            second_separator_text = "|"
-            for x_offset in range(-outline_width, outline_width + 1):
-                for y_offset in range(-outline_width, outline_width + 1):
-                    draw.text((second_separator_position + x_offset, second_separator_y_position + y_offset),
-                              second_separator_text, font=font, fill=outline_color)
-            draw.text((second_separator_position, second_separator_y_position), second_separator_text, font=font, fill="white")
-
-            # Render the XP points with space
-            points_text = f"XP: {int(xp)} Pts"
-            points_bbox = draw.textbbox((0, 0), points_text, font=font)
-            points_height = points_bbox[3] - points_bbox[1]
-            points_y_position = y_position + (57 - points_height) // 2 - 8  # Slightly move XP text upwards
-            points_position = second_separator_position + 20
-            draw.text((points_position, points_y_position), points_text, font=font, fill="white", stroke_width=2, stroke_fill="black")  # Increased stroke width
-            
-            y_position += 60  # Space for next row of text
-
-    img_binary = BytesIO()
-    img.save(img_binary, format="PNG")
-    img_binary.seek(0)
-
-    return img_binary
+        return await loop.run_in_executor(render_pool, fn, *args)
+    except BrokenProcessPool:
+        # The worker died (e.g. killed for memory); start a fresh one and retry once
+        logger.error("Render worker died; restarting the render pool.")
+        render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return await loop.run_in_executor(render_pool, fn, *args)
+
+@profiled
+async def create_leaderboard_image():
+    with RENDER_SECONDS.time(stage="total"):
+        with RENDER_SECONDS.time(stage="members"):
+            top_users = await fetch_top_users_with_xp()  # Example function to fetch users
+
+        # Download (or reuse) all the rounded avatars concurrently
+        with RENDER_SECONDS.time(stage="avatars"):
+            avatars = await avatar_cache.get_many([(user['avatar_key'], user['avatar_url']) for user in top_users])
+
+        # Plain data only, so it can be sent to the render process
+        rows = [
+            {
+                'rank': rank, 'user_id': user['user_id'], 'nickname': user['nickname'], 'xp': user['xp'],
+                'avatar_key': user['avatar_key'], 'avatar': avatar_bytes,
+            }
+            for rank, (user, avatar_bytes) in enumerate(zip(top_users, avatars), 1)
+        ]
+        # Identical boards (e.g. !live right after a publish) share one render
+        with RENDER_SECONDS.time(stage="render"):
+            png_bytes = await render_cache.get(leaderboard_model_key(rows), run_render, render_leaderboard, rows)
+    return BytesIO(png_bytes)
 
 @bot.command(name='live')
 async def live(ctx):
     """Command to immediately send the live leaderboard to the user's channel."""
     await update_leaderboard(ctx)
 
-@tasks.loop(seconds=20)
+@profiled
 async def update_leaderboard(ctx=None):
     """Update the leaderboard and optionally send it to the channel."""
-    global previous_top_10
-    global cached_top_users
     global leaderboard_message
 
     try:
-        # Fetch the current top 10 leaderboard data with extra details
-        current_top_10 = await fetch_top_users_with_xp()
-
-        # Compare with the previous top 10 to detect changes
-        if current_top_10 == previous_top_10:
-            return
-
-        # Update the cached top 10
-        if previous_top_10:
-            cached_top_users.append(previous_top_10)
-
-        if len(cached_top_users) > 1:
-            cached_top_users.pop(0)  # Remove the oldest cached list
-
-        previous_top_10 = current_top_10  # Update the current top 10
-
         # Generate the leaderboard image
         image = await create_leaderboard_image()
 
@@ -727,19 +394,18 @@ async def update_leaderboard(ctx=None):
 
         # Create the embed message
         embed = discord.Embed(
-            title="🏆  Yappers of the day!",
+            title=LEADERBOARD_TITLE,
             description="The leaderboard is live! Check the leaderboard to see if your messages have earned you a spot in the top 10 today!",
             color=discord.Color.gold()
         )
         embed.set_footer(text="To change your name on the leaderboard, Go to User Settings > Account > Server Profile > Server Nickname.")
-        embed.set_thumbnail(url=trophy_gif_url)
-
         # Set the rotating trophy GIF as the thumbnail
-        embed.set_image(url="attachment://leaderboard.png")
+        embed.set_thumbnail(url=trophy_gif_url)
 
         # If the context (ctx) is passed, send the leaderboard to the user's channel
         if ctx:
             # Send the embed and image to the user's channel
+            embed.set_image(url="attachment://leaderboard.png")
             await ctx.send("Here is the live leaderboard!", embed=embed, file=discord.File(image, filename="leaderboard.png"))
         else:
             # Send the leaderboard to the defined leaderboard channel (if periodic update)
@@ -747,23 +413,93 @@ async def update_leaderboard(ctx=None):
             if not channel:
                 logger.error(f"Leaderboard channel not found: {LEADERBOARD_CHANNEL_ID}")
                 return
+            if leaderboard_message is None:
+                # After a restart, take over the message the previous process posted
+                leaderboard_message = await find_leaderboard_message(channel)
+
+            # The attachment is named after its hash, so an identical image is never uploaded twice
+            image_hash = hashlib.sha256(image.getvalue()).hexdigest()[:16]
+            if leaderboard_message and leaderboard_image_hash(leaderboard_message) == image_hash:
+                return
+            filename = f"leaderboard-{image_hash}.png"
+            embed.set_image(url=f"attachment://{filename}")
+            file = discord.File(image, filename=filename)
+
             if leaderboard_message:
-                # Delete the previous message if it exists
-                await leaderboard_message.delete()
-            leaderboard_message = await channel.send(embed=embed, file=discord.File(image, filename="leaderboard.png"))
+                try:
+                    leaderboard_message = await edit_message_file(leaderboard_message, embed, file)
+                    return
+                except discord.NotFound:
+                    logger.info("Leaderboard message was deleted; sending a new one.")
+                except discord.HTTPException as e:
+                    if e.status == 429:
+                        raise
+                    # Replace the message the old way rather than leave the board stale
+                    logger.warning(f"Could not edit the leaderboard message ({e}); sending a new one.")
+                    try:
+                        await leaderboard_message.delete()
+                    except discord.HTTPException:
+                        pass
+                file.reset()  # The failed request already read the image
+                leaderboard_message = None
+            leaderboard_message = await channel.send(embed=embed, file=file)
 
     except discord.HTTPException as e:
         if e.status == 429:
             # Handle rate-limiting errors
-            retry_after = int(e.retry_after)
+            DISCORD_RATE_LIMITS.inc(scope="leaderboard")
+            retry_after = rate_limit_delay(e)
             logger.warning(f"Rate-limited. Retrying after {retry_after} seconds.")
             await asyncio.sleep(retry_after)
+            if not ctx:
+                leaderboard_publisher.notify()  # Retry through the publisher, which keeps the interval
         else:
             logger.error(f"HTTPException while updating leaderboard: {e}")
 
     except Exception as e:
         logger.error(f"Unexpected error in update_leaderboard: {e}")
 
+# Function to get how long to wait after a 429 (discord.py 1.7 only exposes it as the Retry-After header)
+def rate_limit_delay(error):
+    try:
+        return float(error.response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return LEADERBOARD_RETRY_AFTER
+
+# Function to find the bot's most recent leaderboard message in the channel, if any
+async def find_leaderboard_message(channel):
+    try:
+        async for message in channel.history(limit=LEADERBOARD_HISTORY_LIMIT):
+            if message.author == bot.user and message.embeds and message.embeds[0].title == LEADERBOARD_TITLE:
+                return message
+    except discord.HTTPException as e:
+        logger.error(f"Could not search the leaderboard channel history: {e}")
+    return None
+
+# Function to get the image hash from a leaderboard message's attachment name (None if unknown)
+def leaderboard_image_hash(message):
+    for attachment in message.attachments:
+        name = attachment.filename
+        if name.startswith("leaderboard-") and name.endswith(".png"):
+            return name[len("leaderboard-"):-len(".png")]
+    return None
+
+# Function to replace a message's embed and attachment in one request. Message.edit
+# in discord.py 1.7 cannot send files, so this PATCHes the message with a multipart
+# body like send_files does; "attachments": [] drops the previous image.
+async def edit_message_file(message, embed, file):
+    route = Route('PATCH', '/channels/{channel_id}/messages/{message_id}', channel_id=message.channel.id, message_id=message.id)
+    form = [
+        {'name': 'payload_json', 'value': discord.utils.to_json({'embed': embed.to_dict(), 'attachments': []})},
+        {'name': 'file', 'value': file.fp, 'filename': file.filename, 'content_type': 'application/octet-stream'},
+    ]
+    data = await bot.http.request(route, form=form, files=[file])
+    return discord.Message(state=message._state, channel=message.channel, data=data)
+
+# Change-driven leaderboard: the XP index signals top 10 changes, the publisher debounces them
+leaderboard_publisher = LeaderboardPublisher(update_leaderboard)
+xp_index.on_top_change(leaderboard_publisher.notify)
+
 # Role names and messages (same as defined previously)
 ROLE_NAMES = {
     "🧔Homo Sapien": {"message": "🎉 Congrats {member.mention}! You've become a **Homo Sapien** 🧔 and unlocked GIF permissions!", "has_perms": True},
@@ -777,12 +513,27 @@ ROLE_NAMES = {
 
 # Event when a member's roles update
 @bot.event
+@timed_handler
 async def on_member_update(before, after):
+    # Nickname, avatar or roles may have changed; drop any stale copy
+    member_cache.invalidate(after.id)
+
+    # A new name or avatar in the top 10 needs a redraw even though no XP moved
+    if before.display_name != after.display_name or before.avatar != after.avatar:
+        position = xp_index.rank(after.id)
+        if position is not None and position <= xp_index.top_n:
+            leaderboard_publisher.notify()
+
     if before.roles != after.roles:  # If roles have changed
         for role in after.roles:
             if role.name in ROLE_NAMES and role.name not in [r.name for r in before.roles]:
                 await announce_role_update(after, role.name)
 
+@bot.event
+@timed_handler
+async def on_member_remove(member):
+    member_cache.invalidate(member.id)
+
 # Announce role update and send the image
 async def announce_role_update(member, role_name):
     role_info = ROLE_NAMES.get(role_name)
@@ -805,123 +556,98 @@ async def announce_role_update(member, role_name):
             print(f"Channel with ID {ROLE_LOG_CHANNEL_ID} not found.")
        
 
+# Time every command for the metrics endpoint
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    status = "error" if ctx.command_failed else "ok"
+    COMMAND_SECONDS.observe(time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name, status=status)
+
+@bot.command(name='profile')
+@commands.is_owner()
+async def profile(ctx, seconds: float = PROFILE_WINDOW):
+    """Owner only: profile the bot for a while and say where the output went (see profiling.py)."""
+    if profiling.session:
+        await ctx.send("A profiling session is already running.")
+        return
+    seconds = max(1.0, min(seconds, PROFILE_MAX_WINDOW))
+    await ctx.send(f"Profiling for {seconds:.0f}s...")
+    paths = await profile_for(seconds)
+    if paths:
+        await ctx.send("Profile written:\n" + "\n".join(f"`{path}`" for path in paths))
+
 @bot.command(name='hi')
 async def hi(ctx):
     latency = bot.latency * 1000  # Convert latency to milliseconds
     await ctx.send(f'Yes Masta! {latency:.2f}ms')
-    
-async def has_either_role_by_ids(bot, user_id, role_id_1, role_id_2):
-    try:
-        # Get the guild (replace with your actual GUILD_ID)
-        guild = bot.get_guild(GUILD_ID)
 
-        if guild is None:
-            print("Guild not found.")
-            return False
-
-        # Fetch the member using user_id (use fetch_member to get from API)
-        try:
-            member = await guild.fetch_member(user_id)
-        except discord.NotFound:
-            print(f"Member with ID {user_id} not found.")
-            return False
-        except discord.DiscordException as e:
-            print(f"Error fetching member with ID {user_id}: {e}")
-            return False
-
-        # Log member roles for debugging
-        print(f"Checking roles for member {user_id} ({member.name})")
-        
-        # Check if the member has either of the two roles
-        for role in member.roles:
-            if role.id == role_id_1 or role.id == role_id_2:
-                print(f"User {user_id} has one of the required roles.")
-                return True
-        
-        print(f"User {user_id} does not have the required roles.")
-        return False
-    except discord.DiscordException as e:
-        print(f"Error checking roles for user {user_id}: {e}")
-        return False
-
-# Fetch top 10 users with XP and check their roles
-async def fetch_top_10_users_and_check_roles(bot, role_id_1, role_id_2):
-    cursor.execute('''
-        SELECT user_id, xp FROM user_xp
-        ORDER BY xp DESC
-        LIMIT 10
-    ''')
-    top_users = cursor.fetchall()
-
-    # List to store users who have the required role
-    users_with_role = []
-
-    # Iterate over the top 10 users and check if they have either role
-    for user_id, xp in top_users:
-        has_role = await has_either_role_by_ids(bot, user_id, role_id_1, role_id_2)
-        if has_role:
-            users_with_role.append({'user_id': user_id, 'xp': xp})
-
-    return users_with_role
-  
-async def save_user_to_clan_role_table(bot, user_id, xp):
-    try:
-        # Check if the user has the relevant clan role using the bot
-        has_role_1 = await has_either_role_by_ids(bot, user_id, CLAN_ROLE_1_ID, CLAN_ROLE_2_ID)
-
-        if has_role_1:
-            # Only check the role once, and then determine the clan table
-            if await has_either_role_by_ids(bot, user_id, CLAN_ROLE_1_ID, CLAN_ROLE_2_ID):
-                clan_role = 'clan_role_1'
-            else:
-                clan_role = 'clan_role_2'
-
-            # Check if the user already exists in the table
-            cursor.execute(f"SELECT xp FROM {clan_role} WHERE user_id = ?", (user_id,))
-            existing_xp = cursor.fetchone()
+@bot.command(name='rank')
+async def rank(ctx, member: discord.Member = None):
+    """Command to show a member's rank, XP, the gap to the user above them and their neighbours."""
+    member = member or ctx.author
 
-            if existing_xp:
-                # User exists, update their XP
-                new_xp = existing_xp[0] + xp
-                cursor.execute(f"UPDATE {clan_role} SET xp = ? WHERE user_id = ?", (new_xp, user_id))
-            else:
-                # New user, insert their XP
-                cursor.execute(f"INSERT INTO {clan_role} (user_id, xp) VALUES (?, ?)", (user_id, xp))
+    # Served from the in-memory ranking, so this never scans user_xp
+    position = xp_index.rank(member.id)
+    if position is None:
+        await ctx.send(f"**{member.display_name}** hasn't earned any XP yet today.")
+        return
 
-            # Commit the changes to the database
-            conn.commit()
-            print(f"XP for user {user_id} updated in {clan_role} table.")
-        else:
-            print(f"User {user_id} does not have the correct role.")
-    except sqlite3.Error as e:
-        print(f"Error saving XP for user {user_id} in the clan role table: {e}")
-        with open("error_log.txt", "a") as log_file:
-            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error saving XP for user {user_id} in the clan role table: {e}\n")
-
-# Function to calculate total XP for a clan
-async def calculate_clan_xp(clan_role):
-    cursor.execute(f"SELECT SUM(xp) FROM {clan_role}")
-    result = cursor.fetchone()
-    return result[0] if result[0] is not None else 0
-
-# Function to send the clan leaderboard message
-async def send_clan_comparison_leaderboard():
-    # Calculate total XP for both clans
-    total_xp_clan_1 = await calculate_clan_xp("clan_role_1")
-    total_xp_clan_2 = await calculate_clan_xp("clan_role_2")
+    xp = xp_index.xp(member.id)
+    if position == 1:
+        gap_text = "Top of the leaderboard!"
+    else:
+        _, next_xp = xp_index.at(position - 1)
+        gap_text = f"`{next_xp - xp:,}` XP behind #{position - 1}"
+
+    # The places just above and below, from the same ranking
+    neighbours = xp_index.around(position, RANK_NEIGHBOURS)
+    details = await asyncio.gather(*(get_member(user_id) for _, user_id, _ in neighbours))
+    lines = []
+    for (place, user_id, user_xp), detail in zip(neighbours, details):
+        name = detail[0] if detail else f"User {user_id}"
+        marker = "➤" if user_id == member.id else "  "
+        lines.append(f"{marker} `#{place}` {name}  `{user_xp:,}` XP Pts")
+
+    await ctx.send(f"**{member.display_name}** is ranked **#{position}** of {len(xp_index):,} with `{xp:,}` XP Pts. {gap_text}\n"
+                   + "\n".join(lines))
+
+# Function to get a member's clan (its role ID) from their cached roles, or None if they have no clan
+def clan_of(member):
+    for role in getattr(member, "roles", ()):  # Authors of DMs are users, without roles
+        if role.id in CLAN_ROLES:
+            return role.id
+    return None
+
+# Function to rank clan_totals rows (clan_id, xp): one entry per clan, highest first
+def rank_clans(rows):
+    totals = {int(clan_id): xp for clan_id, xp in rows}
+    return sorted(((clan_id, totals.get(clan_id, 0)) for clan_id in CLAN_ROLE_IDS), key=lambda clan: clan[1], reverse=True)
+
+# Function to get every clan's total XP, highest first
+async def fetch_clan_totals():
+    return rank_clans(await db.fetchall("SELECT clan_id, xp FROM clan_totals"))
+
+# Function to send the clan leaderboard message, for the given ranked totals or the live ones
+async def send_clan_comparison_leaderboard(clan_totals=None):
+    if clan_totals is None:
+        # Total XP of every clan, highest first, including XP still in the buffer
+        await flush_buffered_xp()
+        clan_totals = await fetch_clan_totals()
+    clan_totals = clan_totals[:CLAN_LEADERBOARD_SIZE]
 
     # Prepare the message with emojis and clan info
-    one_emoji = "<a:One:1310686608109862962>"
-    two_emoji = "<a:pink_two:1310686637902004224>"
+    rank_emojis = ["<a:One:1310686608109862962>", "<a:pink_two:1310686637902004224>"]
     dash_blue = "<:dash_blue:1310695526244552824>"
-    clan_emoji_1 = "<:grove_Street:1312395110570528828>"
-    
-    # Prepare the message
-    comparison_message = (
-        f"**🏆  Weekly Clan Leaderboard!  🏆**\n\n"  # Added newline after heading
-        f"{one_emoji}{dash_blue}{clan_emoji_1}  <@&{CLAN_ROLE_1_ID}>  `{total_xp_clan_1:,}` XP Pts\n"  # Ping Clan Role 1
-        f"{two_emoji}{dash_blue}<@&{CLAN_ROLE_2_ID}>  `{total_xp_clan_2:,}` XP Pts\n"  # Ping Clan Role 2
-    )
+
+    # Prepare the message, one line (and role ping) per clan
+    comparison_message = "**🏆  Weekly Clan Leaderboard!  🏆**\n\n"  # Added newline after heading
+    for position, (clan_id, total_xp) in enumerate(clan_totals, 1):
+        rank_emoji = rank_emojis[position - 1] if position <= len(rank_emojis) else f"`#{position}`"
+        clan_emoji = f"{CLAN_EMOJIS[clan_id]}  " if clan_id in CLAN_EMOJIS else ""
+        comparison_message += f"{rank_emoji}{dash_blue}{clan_emoji}<@&{clan_id}>  `{total_xp:,}` XP Pts\n"
 
     # Send the message to the desired channel
     channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)  # Change to the desired channel ID
@@ -933,27 +659,39 @@ async def clans(ctx):
     """Command to send the clan comparison leaderboard."""
     await send_clan_comparison_leaderboard()
 
-@tasks.loop(seconds=604800)
-async def reset_weekly():
+# Function to write buffered XP on the DB writer thread
+async def flush_buffered_xp():
+    batch, clan_batch = take_pending_xp()
+    if (batch or clan_batch) and not await db.write(write_xp_batch, batch, clan_batch):
+        restore_pending_xp(batch, clan_batch)  # Retry on the next flush
+
+# Periodically write buffered XP to the database
+@tasks.loop(seconds=XP_FLUSH_INTERVAL)
+async def flush_xp():
     try:
-        remaining_time = time_remaining_until_reset()
-        logger.info(f"Time remaining until next reset: {remaining_time}")
-
-        if remaining_time > timedelta(0):
-            await asyncio.sleep(remaining_time.total_seconds())
-
-        await send_clan_comparison_leaderboard()
-        await reset_clan_xp()
-        await reset_and_save_top_users()
-        write_last_reset_time()
-    except asyncio.CancelledError:
-        logger.info("reset_weekly task was cancelled.")
-        raise
+        await flush_buffered_xp()
     except Exception as e:
-        logger.error(f"Error in reset_weekly task: {e}")
+        logger.error(f"Error flushing buffered XP: {e}")
+
+# Weekly reset (a scheduler job): start a new week, then post the final clan standings.
+# The standings are read in the reset's transaction and only posted once it commits,
+# so a run that was already recorded (or a retry after the post) pings nobody.
+@profiled
+async def reset_weekly(run=None):
+    await flush_buffered_xp()  # Count buffered clan XP in the final standings
+    status, standings = await db.write(reset_clan_tables, run)
+    if status == RESET_FAILED:
+        raise RuntimeError("Clan XP reset failed and was rolled back.")
+    if status == RESET_DONE:
+        await send_clan_comparison_leaderboard(rank_clans(standings))
+
+# Resets run from the scheduled_jobs table, so restarts (see reconnect_bot) don't move them
+scheduler.add_job("daily_reset", D_RESET_INTERVAL, reset_daily_xp, legacy_file=D_LAST_RESET_TIME_FILE)
+scheduler.add_job("weekly_reset", RESET_INTERVAL, reset_weekly, legacy_file=LAST_RESET_TIME_FILE)
 
 def shutdown_handler():
     logger.info("Shutting down bot... Cancelling tasks.")
+    db.submit_write(write_xp_batch, *take_pending_xp())  # Don't lose buffered XP on Ctrl+C
     for task in asyncio.all_tasks():
         logger.info(f"Cancelling task: {task}")
         task.cancel()
@@ -965,7 +703,8 @@ async def close_bot():
     logger.info("Closing bot and cleaning up resources.")
     try:
         await bot.close()
-        conn.close()
+        db.submit_write(write_xp_batch, *take_pending_xp())
+        db.shutdown()
         logger.info("Database connection closed.")
     except Exception as e:
         logger.error(f"Error during bot cleanup: {e}")
@@ -0,0 +1,56 @@
+import asyncio
+from collections import OrderedDict
+
+
+class CoalescingCache:
+    """
+    In-memory LRU whose misses are loaded once, however many callers ask.
+
+    get(key, load, *args) returns the remembered value for key, or awaits
+    load(*args). Concurrent requests for a key that is still loading wait
+    on the same load, and only successful loads are remembered.
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._memory = OrderedDict()  # key -> value, least recently used first
+        self._in_flight = {}  # key -> asyncio.Future
+        self.hits = 0
+        self.shared = 0  # Requests that joined a load already in progress
+        self.loads = 0
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _finished(self, key, future):
+        self._in_flight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._remember(key, future.result())
+
+    async def get(self, key, load, *args):
+        """Return the value for key, awaiting load(*args) only if nobody has loaded it yet."""
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+        future = self._in_flight.get(key)
+        if future is None:
+            self.loads += 1
+            future = asyncio.ensure_future(load(*args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+        # Shielded, so one cancelled caller doesn't cancel the load for the others
+        return await asyncio.shield(future)
+
+    def clear(self):
+        self._memory.clear()
+
+    def __len__(self):
+        return len(self._memory)
@@ -0,0 +1,53 @@
+import logging
+import os
+import sqlite3
+import threading
+
+DATABASE_PATH = 'database.db'
+BUSY_TIMEOUT_MS = 5000  # Wait this long for a lock instead of failing with "database is locked"
+CACHE_SIZE_KIB = 16 * 1024  # Page cache per connection (16 MiB)
+
+logger = logging.getLogger(__name__)
+
+_shared_conn = None
+_shared_lock = threading.Lock()
+
+
+# Function to open a connection with the pragmas every connection should use
+def connect(path=DATABASE_PATH, readonly=False):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")  # Negative value means KiB, not pages
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        # WAL lets readers run while the writer commits; NORMAL only fsyncs at checkpoints
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            logger.warning(f"Could not switch {path} to WAL (journal_mode={mode})")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# Function to get the single shared read/write connection to the database
+def get_connection():
+    global _shared_conn
+    with _shared_lock:
+        if _shared_conn is None:
+            directory = os.path.dirname(os.path.abspath(DATABASE_PATH))
+            if os.path.exists(DATABASE_PATH) and not os.access(DATABASE_PATH, os.W_OK):
+                logger.error(f"{DATABASE_PATH} is not writable; XP updates will fail")
+            elif not os.access(directory, os.W_OK):
+                # WAL needs to create database.db-wal and database.db-shm next to the file
+                logger.error(f"{directory} is not writable; SQLite cannot create its WAL files")
+            _shared_conn = connect(DATABASE_PATH)
+        return _shared_conn
+
+
+# Function to close the shared connection (checkpoints the WAL into the main file)
+def close_connection():
+    global _shared_conn
+    with _shared_lock:
+        if _shared_conn is not None:
+            _shared_conn.close()
+            _shared_conn = None
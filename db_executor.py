@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_connection import DATABASE_PATH, connect, close_connection
+from metrics import DB_SECONDS, DB_QUEUE_SECONDS
+
+DB_READER_THREADS = 2  # Set to 0 to run reads on the writer thread as well
+
+
+class DatabaseExecutor:
+    """
+    Runs SQLite work off the asyncio event loop.
+
+    All writes go through a single writer thread, which is the only thread
+    that touches db_server's connection, so statements never interleave.
+    Reads run on a small pool of reader threads, each with its own read-only
+    connection; with the database in WAL mode they never block the writer.
+    Every call returns an awaitable, so a slow disk no longer blocks the
+    gateway heartbeat or command handling.
+    """
+
+    def __init__(self, path=DATABASE_PATH, readers=DB_READER_THREADS):
+        self.path = path
+        self._local = threading.local()
+        self._reader_conns = []
+        self._reader_conns_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = None
+        if readers > 0:
+            self._readers = ThreadPoolExecutor(
+                max_workers=readers, thread_name_prefix="db-reader", initializer=self._open_reader
+            )
+
+    def _open_reader(self):
+        conn = connect(self.path, readonly=True)
+        self._local.conn = conn
+        with self._reader_conns_lock:
+            self._reader_conns.append(conn)
+
+    def _query(self, sql, params, fetch):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Reads on the writer thread share db_server's connection
+            from db_server import conn
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if fetch == "one" else cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _timed(pool, operation, queued_at, fn, *args):
+        started = time.perf_counter()
+        DB_QUEUE_SECONDS.observe(started - queued_at, pool=pool)
+        try:
+            return fn(*args)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    def submit_write(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on the writer thread and return its concurrent future."""
+        return self._writer.submit(
+            self._timed, "writer", fn.__name__, time.perf_counter(), functools.partial(fn, *args, **kwargs)
+        )
+
+    async def write(self, fn, *args, **kwargs):
+        """Run a synchronous db_server function on the writer thread."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._writer, self._timed, "writer", fn.__name__, time.perf_counter(), functools.partial(fn, *args, **kwargs)
+        )
+
+    async def _read(self, sql, params, fetch):
+        loop = asyncio.get_event_loop()
+        pool = "reader" if self._readers else "writer"
+        return await loop.run_in_executor(
+            self._readers or self._writer, self._timed, pool, f"fetch{fetch}", time.perf_counter(),
+            self._query, sql, params, fetch
+        )
+
+    async def fetchall(self, sql, params=()):
+        return await self._read(sql, params, "all")
+
+    async def fetchone(self, sql, params=()):
+        return await self._read(sql, params, "one")
+
+    def shutdown(self):
+        """Finish queued work, then close the reader and shared connections."""
+        self._writer.shutdown(wait=True)
+        if self._readers:
+            self._readers.shutdown(wait=True)
+        with self._reader_conns_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+        close_connection()
+
+
+db = DatabaseExecutor()
@@ -1,12 +1,14 @@
 import sqlite3
 import time
 import asyncio
+from db_connection import get_connection
+from leaderboard_index import xp_index
 
 GUILD_ID = 1227505156220784692  # Replace with your actual guild ID
-CLAN_ROLE_1_ID = 1245407423917854754  # Replace with your actual Clan Role 1 ID
-CLAN_ROLE_2_ID = 1247225208700665856
-# Open a connection to the SQLite database
-conn = sqlite3.connect('database.db', check_same_thread=False)
+# Per-clan tables from before clan_xp, and the clan role each one belonged to
+LEGACY_CLAN_TABLES = {"clan_role_1": 1245407423917854754, "clan_role_2": 1247225208700665856}
+# Shared connection to the SQLite database (WAL mode, see db_connection.py)
+conn = get_connection()
 cursor = conn.cursor()
 
 # Create the user_xp table
@@ -16,26 +18,44 @@ cursor.execute('''
         xp INTEGER NOT NULL CHECK(xp >= 0)  -- Ensure XP is never negative
     )
 ''')
-cursor.execute('''CREATE TABLE IF NOT EXISTS clan_role_1 (
-            user_id TEXT PRIMARY KEY,
-            xp INTEGER NOT NULL CHECK(xp >= 0)
+# Clan XP per member, for any number of clans (clan_id is the clan role's ID)
+cursor.execute('''CREATE TABLE IF NOT EXISTS clan_xp (
+            clan_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            xp INTEGER NOT NULL CHECK(xp >= 0),
+            PRIMARY KEY (clan_id, user_id)
 )''')
 
-cursor.execute('''CREATE TABLE IF NOT EXISTS clan_role_2 (
-            user_id TEXT PRIMARY KEY,
+# Running total per clan, updated in the same transaction as clan_xp, so !clans reads one row per clan
+cursor.execute('''CREATE TABLE IF NOT EXISTS clan_totals (
+            clan_id TEXT PRIMARY KEY,
             xp INTEGER NOT NULL CHECK(xp >= 0)
 )''')
 
 
+conn.commit()
+
+# Daily/weekly jobs (see scheduler.py): the next run as a UTC ISO 8601 time,
+# and the ID of the last run, written in the same transaction as its work
+cursor.execute('''CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            name TEXT PRIMARY KEY,
+            interval_seconds INTEGER NOT NULL,
+            next_run TEXT NOT NULL,
+            last_run_id TEXT,
+            last_run_at TEXT
+)''')
+
+
 conn.commit()
 
 # Create an index on user_id for faster queries
 cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id_xp ON user_xp (user_id)')
-cursor.execute('CREATE INDEX IF NOT EXISTS idx_clan_role_1_user_id_xp ON clan_role_1 (user_id, xp)')
-cursor.execute('CREATE INDEX IF NOT EXISTS idx_clan_role_2_user_id_xp ON clan_role_2 (user_id, xp)')
 
 conn.commit()
 
+# Load the in-memory ranking; from here on the XP write path keeps it current
+xp_index.rebuild((int(user_id), xp) for user_id, xp in cursor.execute("SELECT user_id, xp FROM user_xp"))
+
 # Function to delete user data
 def delete_user_data(user_id):
     try:
@@ -59,6 +79,222 @@ def update_user_xp(user_id, total_xp):
         print(f"Error updating XP for user {user_id}: {e}")
         with open("error_log.txt", "a") as log_file:
             log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error updating XP for {user_id}: {e}\n")
+# Write-behind XP buffer: per-user deltas accumulated in memory and written to
+# user_xp in one transaction, instead of a commit for every chat message.
+XP_FLUSH_INTERVAL = 5  # Seconds between timed flushes (driven by bot.py)
+XP_FLUSH_MAX_PENDING = 500  # Flush early once this many users are pending
+pending_xp = {}  # user_id -> XP not yet written to the database
+pending_clan_xp = {}  # (clan_id, user_id) -> clan XP not yet written, flushed with pending_xp
+xp_since_reset = None  # user_id -> XP that survives a daily reset in progress (see begin_xp_reset)
+
+# Outcomes of a reset transaction
+RESET_DONE = "reset"
+RESET_SKIPPED = "skipped"  # The scheduler run was already recorded; nothing changed
+RESET_FAILED = "failed"  # Rolled back
+
+# ON CONFLICT ... DO UPDATE (UPSERT) needs SQLite 3.24+
+SUPPORTS_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+# Add XP deltas to a (user_id, xp) table; the caller owns the transaction
+def add_xp_rows(cursor, table, rows):
+    rows = list(rows)
+    if SUPPORTS_UPSERT:
+        cursor.executemany(
+            f"INSERT INTO {table} (user_id, xp) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET xp = xp + excluded.xp",
+            rows,
+        )
+    else:
+        cursor.executemany(f"INSERT OR IGNORE INTO {table} (user_id, xp) VALUES (?, 0)", [(user_id,) for user_id, _ in rows])
+        cursor.executemany(f"UPDATE {table} SET xp = xp + ? WHERE user_id = ?", [(xp, user_id) for user_id, xp in rows])
+
+# Add (clan_id, user_id, xp) deltas to clan_xp and the matching clan_totals; the caller owns the transaction
+def add_clan_xp_rows(cursor, rows):
+    rows = list(rows)
+    totals = {}
+    for clan_id, _, xp in rows:
+        totals[clan_id] = totals.get(clan_id, 0) + xp
+    if SUPPORTS_UPSERT:
+        cursor.executemany(
+            "INSERT INTO clan_xp (clan_id, user_id, xp) VALUES (?, ?, ?) "
+            "ON CONFLICT(clan_id, user_id) DO UPDATE SET xp = xp + excluded.xp",
+            rows,
+        )
+        cursor.executemany(
+            "INSERT INTO clan_totals (clan_id, xp) VALUES (?, ?) "
+            "ON CONFLICT(clan_id) DO UPDATE SET xp = xp + excluded.xp",
+            totals.items(),
+        )
+    else:
+        cursor.executemany("INSERT OR IGNORE INTO clan_xp (clan_id, user_id, xp) VALUES (?, ?, 0)", [(clan_id, user_id) for clan_id, user_id, _ in rows])
+        cursor.executemany("UPDATE clan_xp SET xp = xp + ? WHERE clan_id = ? AND user_id = ?", [(xp, clan_id, user_id) for clan_id, user_id, xp in rows])
+        cursor.executemany("INSERT OR IGNORE INTO clan_totals (clan_id, xp) VALUES (?, 0)", [(clan_id,) for clan_id in totals])
+        cursor.executemany("UPDATE clan_totals SET xp = xp + ? WHERE clan_id = ?", [(xp, clan_id) for clan_id, xp in totals.items()])
+
+# Move XP from the old clan_role_N tables into clan_xp, once
+def migrate_legacy_clan_tables():
+    existing = {name for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    legacy = [table for table in LEGACY_CLAN_TABLES if table in existing]
+    if not legacy:
+        return
+    try:
+        cursor.execute("BEGIN TRANSACTION;")
+        for table in legacy:
+            rows = cursor.execute(f"SELECT user_id, xp FROM {table}").fetchall()
+            add_clan_xp_rows(cursor, [(LEGACY_CLAN_TABLES[table], user_id, xp) for user_id, xp in rows])
+            cursor.execute(f"DROP TABLE {table}")
+        conn.commit()
+        print(f"Migrated {', '.join(legacy)} into clan_xp.")
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error migrating the clan tables: {e}")
+        with open("error_log.txt", "a") as log_file:
+            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error migrating the clan tables: {e}\n")
+
+migrate_legacy_clan_tables()
+
+# The buffer itself is only touched from the event loop thread; the
+# transaction in write_xp_batch runs on the database writer thread.
+
+# Function to buffer an XP award, crediting clan_id too if the user is in a
+# clan; returns True once the buffer should be flushed
+def queue_user_xp(user_id, total_xp, clan_id=None):
+    pending_xp[user_id] = pending_xp.get(user_id, 0) + total_xp
+    if clan_id is not None:
+        key = (clan_id, user_id)
+        pending_clan_xp[key] = pending_clan_xp.get(key, 0) + total_xp
+    if xp_since_reset is not None:
+        xp_since_reset[user_id] = xp_since_reset.get(user_id, 0) + total_xp
+    xp_index.add(user_id, total_xp)
+    return len(pending_xp) >= XP_FLUSH_MAX_PENDING
+
+# Function to hand over everything buffered so far, as (user XP, clan XP), and start a new buffer
+def take_pending_xp():
+    global pending_xp, pending_clan_xp
+    batch, pending_xp = pending_xp, {}
+    clan_batch, pending_clan_xp = pending_clan_xp, {}
+    return batch, clan_batch
+
+# Function to count users with buffered XP (for the metrics endpoint)
+def pending_xp_users():
+    return len(pending_xp)
+
+# Function to put a batch that failed to write back into the buffer
+def restore_pending_xp(batch, clan_batch=None):
+    for user_id, xp in batch.items():
+        pending_xp[user_id] = pending_xp.get(user_id, 0) + xp
+    for key, xp in (clan_batch or {}).items():
+        pending_clan_xp[key] = pending_clan_xp.get(key, 0) + xp
+
+# Function to drop buffered and ranked XP for a user who left the guild. Their
+# buffered clan XP is kept on purpose: XP earned while still a member stays with
+# the clan, as their clan_xp row does when delete_user_data removes their user_xp.
+def discard_user_xp(user_id):
+    pending_xp.pop(int(user_id), None)  # Buffered keys are Discord's int IDs
+    if xp_since_reset is not None:
+        xp_since_reset.pop(int(user_id), None)
+    xp_index.remove(int(user_id))
+
+# Functions to keep the ranking in step with a daily reset. Call begin_xp_reset
+# in the same step as queueing the DELETE: XP buffered at that point, and all
+# XP queued after it, is written after the DELETE and survives it, even if a
+# flush writes it before the reset's outcome is known. finish_xp_reset ranks
+# just that XP if the DELETE committed, and leaves the ranking alone otherwise.
+def begin_xp_reset():
+    global xp_since_reset
+    xp_since_reset = dict(pending_xp)
+
+def finish_xp_reset(status):
+    global xp_since_reset
+    surviving, xp_since_reset = xp_since_reset, None
+    if status == RESET_DONE:
+        xp_index.rebuild(surviving.items())
+
+# Function to write a batch of XP deltas, and the clan XP earned with them, in a single transaction
+def write_xp_batch(batch, clan_batch=None):
+    if not batch and not clan_batch:
+        return True
+    try:
+        cursor.execute("BEGIN TRANSACTION;")
+        add_xp_rows(cursor, "user_xp", batch.items())
+        if clan_batch:
+            add_clan_xp_rows(cursor, [(clan_id, user_id, xp) for (clan_id, user_id), xp in clan_batch.items()])
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error flushing buffered XP for {len(batch)} users: {e}")
+        with open("error_log.txt", "a") as log_file:
+            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error flushing buffered XP for {len(batch)} users: {e}\n")
+        return False
+
+# Function to flush the buffer synchronously (used when no event loop is left)
+def flush_xp_buffer():
+    batch, clan_batch = take_pending_xp()
+    if not write_xp_batch(batch, clan_batch):
+        restore_pending_xp(batch, clan_batch)
+    return len(batch)
+
+# Function to add a scheduled job if it doesn't exist yet (an existing schedule is kept)
+def seed_scheduled_job(name, interval_seconds, next_run):
+    cursor.execute(
+        "INSERT OR IGNORE INTO scheduled_jobs (name, interval_seconds, next_run) VALUES (?, ?, ?)",
+        (name, interval_seconds, next_run),
+    )
+    conn.commit()
+
+# Record a job run and move the job to its next run, if the run is still due;
+# the caller owns the transaction, so the record commits with the job's work
+def complete_job_run(cursor, run):
+    cursor.execute(
+        "UPDATE scheduled_jobs SET next_run = ?, last_run_id = ?, last_run_at = ? WHERE name = ? AND next_run = ?",
+        (run.next_run, run.run_id, run.started_at, run.name, run.scheduled_for),
+    )
+    return cursor.rowcount == 1
+
+# Function to clear all XP (daily reset); clan XP is credited as it is earned, so it is kept.
+# With a scheduler run, the reset and the run's record commit together, and a
+# run that was already recorded changes nothing. Returns a RESET_* outcome.
+def reset_user_xp(run=None):
+    try:
+        cursor.execute("BEGIN TRANSACTION;")
+        if run is not None and not complete_job_run(cursor, run):
+            conn.rollback()
+            print(f"Skipping {run.run_id}: it has already run.")
+            return RESET_SKIPPED
+        cursor.execute("DELETE FROM user_xp;")  # Clears all XP data
+        conn.commit()
+        print("Database has been reset.")
+        return RESET_DONE
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error resetting the database: {e}")
+        with open("error_log.txt", "a") as log_file:
+            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error resetting the database: {e}\n")
+        return RESET_FAILED
+
+# Function to reset the clan XP of every clan (weekly reset); a scheduler run is recorded as in reset_user_xp.
+# Returns a RESET_* outcome and, when it reset, the clan_totals rows it cleared
+def reset_clan_tables(run=None):
+    try:
+        cursor.execute("BEGIN TRANSACTION;")
+        if run is not None and not complete_job_run(cursor, run):
+            conn.rollback()
+            print(f"Skipping {run.run_id}: it has already run.")
+            return RESET_SKIPPED, []
+        standings = cursor.execute("SELECT clan_id, xp FROM clan_totals").fetchall()
+        cursor.execute("DELETE FROM clan_xp")
+        cursor.execute("DELETE FROM clan_totals")
+        conn.commit()
+        print("Clan XP tables have been reset.")
+        return RESET_DONE, standings
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error resetting clan XP tables: {e}")
+        with open("error_log.txt", "a") as log_file:
+            log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Error resetting clan XP tables: {e}\n")
+        return RESET_FAILED, []
+
 # Function to clean up invalid users
 def cleanup_invalid_users():
     try:
@@ -0,0 +1,104 @@
+import re
+from collections import namedtuple
+
+import emoji
+
+# Unicode emoji tokenizer. Splits text into whole emoji sequences (ZWJ
+# sequences such as 👨‍💻, skin tones, keycaps, flags and tag sequences) instead
+# of single codepoints, so 👨‍💻 is one emoji rather than 👨 + 💻.
+#
+# The pattern follows the emoji sequence grammar of UTS #51 and is built once
+# from the emoji package's data. Its character classes are split so that
+# ordinary text is rejected by a single lookahead per character; scanning is
+# several times faster than emoji.emoji_list and about as fast as the old
+# per-character emoji.is_emoji loop.
+
+EmojiToken = namedtuple("EmojiToken", ["emoji", "start", "end"])
+
+ZWJ = "\u200d"
+VARIATION_SELECTOR = "\ufe0f"
+KEYCAP = "\u20e3"
+REGIONAL_INDICATORS = range(0x1F1E6, 0x1F200)  # Flags are pairs of these
+SKIN_TONES = range(0x1F3FB, 0x1F400)
+
+
+def _ranges(codepoints):
+    ranges = []
+    for codepoint in sorted(codepoints):
+        if ranges and codepoint - ranges[-1][1] <= 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return ranges
+
+
+def _char_class(ranges):
+    parts = []
+    for first, last in ranges:
+        parts.append(re.escape(chr(first)))
+        if last != first:
+            parts.append("-" + re.escape(chr(last)))
+    return "[" + "".join(parts) + "]"
+
+
+def _build_regex():
+    bases = set()  # Codepoints that are an emoji on their own
+    modifier_bases = set()  # Codepoints that take a skin tone
+    for sequence in emoji.EMOJI_DATA:
+        core = sequence.rstrip(VARIATION_SELECTOR)
+        if len(core) == 1 and core not in "#*0123456789" and ord(core) not in REGIONAL_INDICATORS:
+            bases.add(ord(core))
+        if len(sequence) > 1 and ord(sequence[1]) in SKIN_TONES:
+            modifier_bases.add(ord(sequence[0]))
+
+    base_ranges = _ranges(bases)
+    bmp = _char_class([r for r in base_ranges if r[1] <= 0xFFFF])
+    astral = _char_class([r for r in base_ranges if r[0] > 0xFFFF])
+    # Every sequence starts with one of these: BMP emoji, keycap bases or the astral emoji block
+    start_chars = "#*0-9" + bmp[1:-1] + "\U0001F000-\U0001FAFF"
+
+    element = (
+        f"(?:{bmp}|{astral})"
+        f"(?:{VARIATION_SELECTOR}|(?<={_char_class(_ranges(modifier_bases))})[\U0001F3FB-\U0001F3FF])?"
+        "(?:[\U000E0020-\U000E007E]+\U000E007F)?"  # Tag sequences, e.g. subdivision flags
+    )
+    sequence = (
+        f"[#*0-9]{VARIATION_SELECTOR}?{KEYCAP}"
+        "|[\U0001F1E6-\U0001F1FF]{2}"
+        f"|{element}(?:{ZWJ}{element})*"
+    )
+    return start_chars, sequence
+
+
+# EMOJI_START_CHARS is the body of a character class; the lookahead on it is the
+# one cheap check ordinary text has to pass
+EMOJI_START_CHARS, EMOJI_SEQUENCE_REGEX = _build_regex()
+EMOJI_PATTERN = re.compile(f"(?=[{EMOJI_START_CHARS}])(?:{EMOJI_SEQUENCE_REGEX})")
+
+
+# Function to find every emoji sequence in text, with its offsets
+def tokenize_emoji(text):
+    return [EmojiToken(m.group(), m.start(), m.end()) for m in EMOJI_PATTERN.finditer(text)]
+
+
+# Function to count emoji in text, one per full sequence
+def count_emoji(text):
+    return sum(1 for _ in EMOJI_PATTERN.finditer(text))
+
+
+# Function to split text into (text without emoji, [emoji sequences])
+def split_emoji(text):
+    return EMOJI_PATTERN.sub("", text), EMOJI_PATTERN.findall(text)
+
+
+# Function to get candidate emoji_images file names (without .png) for a sequence,
+# most specific first: 1f468-200d-1f4bb, then without FE0F, then the base emoji
+def emoji_file_keys(sequence):
+    codepoints = [format(ord(char), 'x') for char in sequence]
+    keys = ["-".join(codepoints)]
+    stripped = "-".join(c for c in codepoints if c != "fe0f")
+    if stripped not in keys:
+        keys.append(stripped)
+    if codepoints[0] not in keys:
+        keys.append(codepoints[0])
+    return keys
@@ -0,0 +1,220 @@
+import random
+
+MAX_LEVEL = 32  # Enough levels for far more users than a guild will ever have
+TOP_N = 10  # Size of the leaderboard watched for changes
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # Bottom-level steps to the node in self.next
+
+
+class LeaderboardIndex:
+    """
+    In-memory XP ranking kept in an indexable skip list.
+
+    Entries are ordered by XP (highest first), ties by user ID. Every
+    operation is O(log n): updating a user's XP, looking up a rank, and
+    seeking to the Nth place for top-N and "around me" queries. Ranks are
+    1-based, like the leaderboard.
+
+    The index also watches its top top_n entries: callbacks registered with
+    on_top_change run (synchronously) after any update that changes who is
+    in the top top_n, their order or their XP, and never for updates below
+    it.
+    """
+
+    def __init__(self, top_n=TOP_N):
+        self._scores = {}  # user_id -> xp
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self.top_n = top_n
+        self._cutoff = None  # Key of the top_n-th entry; None while there are fewer entries
+        self._top_listeners = []
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    # Skip list internals: keys are (-xp, user_id), so ascending order is the leaderboard order
+    def _find_chain(self, key):
+        chain = [None] * self._level
+        steps = [0] * self._level
+        node, position = self._head, 0
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            steps[level] = position
+        return chain, steps, position
+
+    @staticmethod
+    def _random_level():
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        chain, steps, position = self._find_chain(key)
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                self._head.next[i] = None
+                # The skip list holds len(self._scores) - 1 nodes until this one is linked in
+                self._head.width[i] = len(self._scores)
+                chain.append(self._head)
+                steps.append(0)
+            self._level = level
+
+        node = _Node(key, level)
+        for i in range(level):
+            prev = chain[i]
+            skipped = position - steps[i]
+            node.next[i] = prev.next[i]
+            node.width[i] = prev.width[i] - skipped
+            prev.next[i] = node
+            prev.width[i] = skipped + 1
+        for i in range(level, self._level):
+            chain[i].width[i] += 1
+
+    def _remove(self, key):
+        chain, _, _ = self._find_chain(key)
+        node = chain[0].next[0]
+        for i in range(self._level):
+            prev = chain[i]
+            if prev.next[i] is node:
+                prev.width[i] += node.width[i] - 1
+                prev.next[i] = node.next[i]
+            else:
+                prev.width[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+
+    def _node_at(self, rank):
+        node, remaining = self._head, rank
+        for level in reversed(range(self._level)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    # Top-N change tracking: an update matters only if its old or new key sorts
+    # at or above the current top_n-th key
+    def _top_changed(self):
+        self._cutoff = self._node_at(self.top_n).key if len(self._scores) >= self.top_n else None
+        for callback in self._top_listeners:
+            callback()
+
+    def _check_top(self, old_key, new_key):
+        cutoff = self._cutoff
+        if cutoff is None or (old_key is not None and old_key <= cutoff) or (new_key is not None and new_key <= cutoff):
+            self._top_changed()
+
+    # Public API
+    def on_top_change(self, callback):
+        """Call callback() whenever the top top_n entries change."""
+        self._top_listeners.append(callback)
+
+    def set(self, user_id, xp):
+        """Set a user's XP, inserting them if needed."""
+        old = self._scores.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+        self._scores[user_id] = xp
+        self._insert((-xp, user_id))
+        self._check_top(None if old is None else (-old, user_id), (-xp, user_id))
+
+    def add(self, user_id, delta):
+        """Add XP to a user (as the XP write path does) and return their new total."""
+        xp = self._scores.get(user_id, 0) + delta
+        self.set(user_id, xp)
+        return xp
+
+    def remove(self, user_id):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._remove((-old, user_id))
+            self._check_top((-old, user_id), None)
+
+    def clear(self):
+        self._scores = {}
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._cutoff = None
+
+    def rebuild(self, rows):
+        """Replace the contents with (user_id, xp) rows, e.g. from the user_xp table."""
+        self.clear()
+        for user_id, xp in rows:
+            self._scores[user_id] = self._scores.get(user_id, 0) + xp
+
+        # Link the sorted keys in one pass instead of n separate inserts
+        last = [self._head] * MAX_LEVEL
+        last_position = [0] * MAX_LEVEL
+        keys = sorted((-xp, user_id) for user_id, xp in self._scores.items())
+        for position, key in enumerate(keys, 1):
+            level = self._random_level()
+            node = _Node(key, level)
+            for i in range(level):
+                last[i].next[i] = node
+                last[i].width[i] = position - last_position[i]
+                last[i] = node
+                last_position[i] = position
+            self._level = max(self._level, level)
+        for i in range(self._level):
+            last[i].width[i] = len(keys) + 1 - last_position[i]
+        self._top_changed()
+
+    def xp(self, user_id):
+        return self._scores.get(user_id)
+
+    def rank(self, user_id):
+        """Return a user's 1-based rank, or None if they have no XP entry."""
+        xp = self._scores.get(user_id)
+        if xp is None:
+            return None
+        return self._find_chain((-xp, user_id))[2] + 1
+
+    def at(self, rank):
+        """Return (user_id, xp) at a 1-based rank, or None if out of range."""
+        if not 1 <= rank <= len(self._scores):
+            return None
+        key = self._node_at(rank).key
+        return key[1], -key[0]
+
+    def range(self, start_rank, count):
+        """Return [(rank, user_id, xp), ...] for up to count entries starting at start_rank."""
+        start_rank = max(start_rank, 1)
+        if count <= 0 or start_rank > len(self._scores):
+            return []
+        entries = []
+        node = self._node_at(start_rank)
+        rank = start_rank
+        while node is not None and len(entries) < count:
+            entries.append((rank, node.key[1], -node.key[0]))
+            node = node.next[0]
+            rank += 1
+        return entries
+
+    def top(self, n=10):
+        """Return the top n users as [(user_id, xp), ...], highest XP first."""
+        return [(user_id, xp) for _, user_id, xp in self.range(1, n)]
+
+    def around(self, rank, radius=2):
+        """Return the entries within radius places of rank, as [(rank, user_id, xp), ...]."""
+        start_rank = max(rank - radius, 1)
+        return self.range(start_rank, rank + radius - start_rank + 1)
+
+
+# Ranking of user_xp, kept current by db_server's XP write path
+xp_index = LeaderboardIndex()
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+
+from metrics import LEADERBOARD_EVENTS
+
+# The live leaderboard is redrawn when the top 10 changes, not on a timer.
+# xp_index calls notify() on every change to its top entries; the publisher
+# waits LEADERBOARD_SETTLE_DELAY for the burst to settle, never publishes
+# more often than LEADERBOARD_MIN_INTERVAL, and folds every signal that
+# arrives in between into the next publish. An idle server does no work.
+
+LEADERBOARD_MIN_INTERVAL = 20  # Seconds between publishes (the old polling period)
+LEADERBOARD_SETTLE_DELAY = 2  # Seconds to let a burst of XP writes settle before drawing
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardPublisher:
+    """Debounces top-N change signals into at most one publish per interval."""
+
+    def __init__(self, publish, min_interval=LEADERBOARD_MIN_INTERVAL, settle_delay=LEADERBOARD_SETTLE_DELAY):
+        self.publish = publish  # Coroutine function that renders and posts the leaderboard
+        self.min_interval = min_interval
+        self.settle_delay = settle_delay
+        self._dirty = False
+        self._task = None
+        self._started = False
+        self._last_publish = None  # monotonic time the last publish started
+
+    def start(self):
+        """Start publishing (from on_ready); draws once for the current state."""
+        self._started = True
+        self.notify()
+
+    def notify(self):
+        """Mark the leaderboard stale. Cheap and synchronous; call it from the event loop."""
+        LEADERBOARD_EVENTS.inc(event="signal")
+        self._dirty = True
+        if self._started and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        self._started = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while self._dirty:
+            delay = self.settle_delay
+            if self._last_publish is not None:
+                delay = max(delay, self._last_publish + self.min_interval - time.monotonic())
+            await asyncio.sleep(delay)
+
+            # Everything signalled up to here is covered by this publish
+            self._dirty = False
+            self._last_publish = time.monotonic()
+            LEADERBOARD_EVENTS.inc(event="publish")
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing the leaderboard: {e}")
@@ -0,0 +1,186 @@
+import logging
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from emoji_tokens import split_emoji
+from render_resources import get_font, rank_label_sprite, separator_sprite, paste_sprite, emoji_sprite
+
+# Leaderboard drawing. Nothing in here touches Discord or the event loop, so
+# bot.py can run render_leaderboard in a worker process.
+
+logger = logging.getLogger(__name__)
+
+def render_nickname_with_emoji_images(draw, img, nickname, position, font, emoji_size=28, emoji_offset=5):
+    """
+    Renders the nickname with emojis, where emojis are slightly offset down from the text.
+    
+    :param draw: ImageDraw object to draw text and emojis
+    :param img: Image object where the nickname and emojis will be rendered
+    :param nickname: The string nickname with embedded emojis
+    :param position: The (x, y) position where the text should start
+    :param font: The font to use for rendering the text
+    :param emoji_size: The size of the emoji to render
+    :param emoji_offset: The vertical offset to move the emojis down (default 5 pixels)
+    """
+
+    # Split the nickname into text and whole emoji sequences (👨‍💻 is one emoji, not 👨 + 💻)
+    text_part, emoji_part = split_emoji(nickname)
+
+    # Increase outline thickness for better visibility
+    stroke_width = 2  # Increased stroke width for thicker outline
+
+    # Draw regular text first with outline
+    draw.text(position, text_part, font=font, fill="white", stroke_width=stroke_width, stroke_fill="black")
+
+    # Get the bounding box of the regular text to position the emojis correctly
+    text_bbox = draw.textbbox((0, 0), text_part, font=font)
+    text_width = text_bbox[2] - text_bbox[0]  # Width of the regular text part
+
+    # Adjust the position to draw emojis after the regular text
+    emoji_position = (position[0] + text_width + 5, position[1] + emoji_offset)  # Adjust y position by emoji_offset
+
+    # Loop through each emoji sequence and render it as an image
+    for sequence in emoji_part:
+        emoji_img = emoji_sprite(sequence, emoji_size)  # Pre-resized RGBA image, no disk access
+
+        if emoji_img:
+            # Paste the emoji image (uses transparency properly)
+            img.paste(emoji_img, emoji_position, emoji_img)  # Use alpha channel for transparency
+
+            # Update position for the next emoji
+            emoji_position = (emoji_position[0] + emoji_size + 5, emoji_position[1])
+
+WIDTH = 800  # Image width
+HEIGHT = 600  # Image height
+PADDING = 10  # Padding for layout
+ROW_HEIGHT = 60  # Vertical space per row; each row is drawn as one tile of this height
+ROW_TILE_CACHE_SIZE = 64  # Rendered rows kept between renders
+
+# Rank-specific background colors
+RANK_COLORS = {
+    1: "#FFD700",  # Gold for Rank 1
+    2: "#E6E8FA",  # Silver for Rank 2
+    3: "#CD7F32",  # Bronze for Rank 3
+}
+
+# Rendered row tiles, keyed by everything that is drawn on the row
+row_tiles = OrderedDict()
+
+
+def row_tile_key(row):
+    # Everything that changes the pixels of a row; XP as displayed, and whether
+    # the avatar was drawn or the grey placeholder (a failed fetch has the same avatar_key)
+    return (row['rank'], row['user_id'], row['nickname'], row['avatar_key'], int(row['xp']), bool(row['avatar']))
+
+
+def render_row(row):
+    """Draws one leaderboard row onto a transparent WIDTH x ROW_HEIGHT tile."""
+    font = get_font()
+    img = Image.new("RGBA", (WIDTH, ROW_HEIGHT), color=(0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    y_position = 0  # Tiles are placed at their row's offset when composed
+    rank = row['rank']
+    xp = row['xp']
+    nickname = row['nickname']
+    avatar_bytes = row['avatar']
+
+    # Set background color based on rank
+    rank_bg_color = RANK_COLORS.get(rank, "#36393e")
+
+    # Draw the rounded rectangle for the rank
+    draw.rounded_rectangle(
+        [(PADDING, y_position), (WIDTH - PADDING, y_position + 57)],
+        radius=10,  # Adjust radius for corner rounding
+        fill=rank_bg_color
+    )
+
+    # User profile picture, already resized to 57x58 and rounded
+    if avatar_bytes:
+        img_pfp = Image.open(BytesIO(avatar_bytes))
+    else:
+        img_pfp = Image.new('RGBA', (57, 57), color=(128, 128, 128, 255))  # Default grey circle
+
+    img.paste(img_pfp, (PADDING, y_position), img_pfp)  # Use the alpha mask when pasting
+
+    # Render rank text (pre-rendered with its outline)
+    rank_sprite = rank_label_sprite(rank)
+    rank_bbox = rank_sprite.bbox
+    rank_height = rank_bbox[3] - rank_bbox[1]  # Height of rank text
+    rank_y_position = y_position + (57 - rank_height) // 2 - 8  # Slightly move text upwards (adjust -8 value)
+    paste_sprite(img, rank_sprite, (PADDING + 65, rank_y_position))
+
+    # Calculate width for separators and nickname
+    rank_width = rank_bbox[2] - rank_bbox[0]
+
+    # Slightly decrease the gap between rank number and the first separator
+    first_separator_position = PADDING + 65 + rank_width + 10  # Decreased gap by changing +15 to +10
+
+    # Render the first "|" separator with outline
+    first_separator_y_position = rank_y_position
+    paste_sprite(img, separator_sprite(), (first_separator_position, first_separator_y_position))
+
+    # Render the nickname with emojis
+    nickname_bbox = draw.textbbox((0, 0), nickname, font=font)
+    nickname_y_position = y_position + (57 - (nickname_bbox[3] - nickname_bbox[1])) // 2 - 8  # Slightly move nickname text upwards
+    render_nickname_with_emoji_images(draw, img, nickname, (first_separator_position + 20, nickname_y_position), font)
+
+    # Calculate space between nickname and second separator, taking emojis into account
+    nickname_width = nickname_bbox[2] - nickname_bbox[0]  # Get width of nickname text
+    emoji_gap = 12  # Extra space if there are emojis
+    second_separator_position = first_separator_position + 20 + nickname_width + emoji_gap  # Add space between nickname and second separator
+
+    # Render the second "|" separator with outline
+    second_separator_y_position = nickname_y_position
+    paste_sprite(img, separator_sprite(), (second_separator_position, second_separator_y_position))
+
+    # Render the XP points with space
+    points_text = f"XP: {int(xp)} Pts"
+    points_bbox = draw.textbbox((0, 0), points_text, font=font)
+    points_height = points_bbox[3] - points_bbox[1]
+    points_y_position = y_position + (57 - points_height) // 2 - 8  # Slightly move XP text upwards
+    points_position = second_separator_position + 20
+    draw.text((points_position, points_y_position), points_text, font=font, fill="white", stroke_width=2, stroke_fill="black")  # Increased stroke width
+
+    return img
+
+
+def render_leaderboard(rows):
+    """
+    Draws the leaderboard and returns it as PNG bytes.
+
+    Pure function of plain data so it can run in a worker process. Each row
+    is a dict with 'rank', 'user_id', 'nickname', 'xp', 'avatar_key' and
+    'avatar' (the rounded 57x58 avatar as PNG bytes, or None for a grey
+    placeholder). Rows are cached as tiles keyed by what they show, so an
+    update usually redraws only the rows that changed; the image is then
+    composed from the tiles.
+    """
+    img = Image.new("RGBA", (WIDTH, HEIGHT), color=(0, 0, 0, 0))  # Transparent background (alpha=0)
+
+    if not rows:
+        # If no users fetched, display a message
+        draw = ImageDraw.Draw(img)
+        draw.text((PADDING, PADDING), "Bruh sadly No-one is yapping right now...", font=get_font(), fill="white")
+    else:
+        y_position = PADDING
+        for row in rows:
+            key = row_tile_key(row)
+            tile = row_tiles.get(key)
+            if tile is None:
+                tile = render_row(row)
+                row_tiles[key] = tile
+                while len(row_tiles) > ROW_TILE_CACHE_SIZE:
+                    row_tiles.popitem(last=False)
+            else:
+                row_tiles.move_to_end(key)
+
+            # Rows don't overlap, so pasting the tile gives the same pixels as drawing in place
+            img.paste(tile, (0, y_position))
+            y_position += ROW_HEIGHT  # Space for next row of text
+
+    img_binary = BytesIO()
+    img.save(img_binary, format="PNG")
+    return img_binary.getvalue()
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+
+import discord
+
+MEMBER_CACHE_TTL = 300  # Seconds a REST-fetched member is reused
+MEMBER_CACHE_MAX_SIZE = 5000  # Members kept at most; the oldest are dropped first
+
+
+class MemberCache:
+    """
+    Member lookup that avoids guild.fetch_member REST calls.
+
+    Lookups try the gateway member cache (guild.get_member) first, then
+    members fetched over REST in the last MEMBER_CACHE_TTL seconds, and only
+    then fetch_member. Members who are not in the guild are cached as None
+    too, so a departed user is not re-fetched on every leaderboard tick.
+    Call invalidate() from on_member_update/on_member_remove.
+    """
+
+    def __init__(self, ttl=MEMBER_CACHE_TTL, max_size=MEMBER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._members = OrderedDict()  # user_id -> (member or None, expires_at), oldest first
+        self.gateway_hits = 0
+        self.local_hits = 0
+        self.misses = 0  # Lookups that needed a REST fetch
+
+    async def get(self, guild, user_id):
+        """Return the discord.Member for user_id, or None if they are not in the guild."""
+        user_id = int(user_id)  # user_xp stores IDs as text
+
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.gateway_hits += 1
+            return member
+
+        now = time.monotonic()
+        cached = self._members.get(user_id)
+        if cached is not None and cached[1] > now:
+            self.local_hits += 1
+            return cached[0]
+
+        self.misses += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        self._store(user_id, member)
+        return member
+
+    def _store(self, user_id, member):
+        # Stored at the end, so entries stay in expiry order (the TTL is fixed)
+        now = time.monotonic()
+        self._members.pop(user_id, None)
+        self._members[user_id] = (member, now + self.ttl)
+        # Drop expired entries, then the oldest ones while the cache is over max_size
+        while self._members:
+            oldest = next(iter(self._members.values()))
+            if oldest[1] > now and len(self._members) <= self.max_size:
+                break
+            self._members.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._members.pop(int(user_id), None)
+
+    def clear(self):
+        self._members.clear()
+
+    def stats(self):
+        lookups = self.gateway_hits + self.local_hits + self.misses
+        return {
+            "gateway_hits": self.gateway_hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "hit_rate": (self.gateway_hits + self.local_hits) / lookups if lookups else 0.0,
+            "size": len(self._members),
+        }
+
+
+member_cache = MemberCache()
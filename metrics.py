@@ -0,0 +1,257 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics in the Prometheus text format, served on localhost.
+#
+#   curl http://127.0.0.1:9108/metrics
+#
+# Handlers, the database threads and the render path record into the
+# histograms and counters below; gauges registered with gauge_callback are
+# read when the endpoint is scraped.
+
+METRICS_HOST = "127.0.0.1"  # Local only; put a reverse proxy in front to expose it
+METRICS_PORT = 9108
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event-loop lag samples
+
+# Bucket upper bounds in seconds, from a fast SQLite statement to a stalled render
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # The DB threads record too
+        self._values = {}  # label values -> metric state
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, state in items:
+            lines.extend(self._render_sample(key, state))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class GaugeCallback(_Metric):
+    """A gauge whose value is read from a function at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn):
+        super().__init__(name, documentation)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning(f"Could not read gauge {self.name}: {e}")
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram of durations in seconds, with a sum and count per label set."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge_callback(self, name, documentation, fn):
+        return self._register(GaugeCallback(name, documentation, fn))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry and the bot's metrics
+metrics = MetricsRegistry()
+
+EVENT_LOOP_LAG = metrics.histogram(
+    "goku_event_loop_lag_seconds", "How late the event loop woke a sleeping task")
+HANDLER_SECONDS = metrics.histogram(
+    "goku_handler_seconds", "Time spent in Discord event handlers", ["handler"])
+COMMAND_SECONDS = metrics.histogram(
+    "goku_command_seconds", "Time spent running bot commands", ["command", "status"])
+DB_SECONDS = metrics.histogram(
+    "goku_db_seconds", "Time SQLite work took on a database thread", ["operation"])
+DB_QUEUE_SECONDS = metrics.histogram(
+    "goku_db_queue_seconds", "Time SQLite work waited for a database thread", ["pool"])
+RENDER_SECONDS = metrics.histogram(
+    "goku_render_seconds", "Time spent building the leaderboard image, by stage", ["stage"])
+DISCORD_RATE_LIMITS = metrics.counter(
+    "goku_discord_rate_limits_total", "HTTP 429 responses from Discord", ["scope"])
+LEADERBOARD_EVENTS = metrics.counter(
+    "goku_leaderboard_events_total", "Top-10 change signals and the leaderboard publishes they led to", ["event"])
+
+
+# Decorator to time an event handler (keeps the name, so @bot.event still works)
+def timed_handler(coro):
+    @functools.wraps(coro)
+    async def wrapper(*args, **kwargs):
+        with HANDLER_SECONDS.time(handler=coro.__name__):
+            return await coro(*args, **kwargs)
+    return wrapper
+
+
+# Function to sample event-loop lag until cancelled
+async def sample_loop_lag(interval=LOOP_LAG_INTERVAL):
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(time.perf_counter() - expected, 0.0))
+
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    Counts the 429s discord.py handles itself, which it only reports by logging.
+
+    discord.py logs "We are being rate limited" for every 429 and, for a
+    global one, "Global rate limit has been hit" straight after it without
+    yielding to the loop. So a 429 is held until the loop's next callback,
+    and counted as global if the second warning claimed it by then.
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self._pending = 0  # 429s logged in the current loop callback, not counted yet
+
+    def emit(self, record):
+        message = str(record.msg)
+        if message.startswith("We are being rate limited"):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # Not logged from the event loop; nothing can follow it
+                DISCORD_RATE_LIMITS.inc(scope="bucket")
+                return
+            self._pending += 1
+            if self._pending == 1:
+                loop.call_soon(self._count_pending)
+        elif message.startswith("Global rate limit has been hit"):
+            if self._pending:
+                self._pending -= 1
+            DISCORD_RATE_LIMITS.inc(scope="global")
+
+    def _count_pending(self):
+        pending, self._pending = self._pending, 0
+        if pending:
+            DISCORD_RATE_LIMITS.inc(pending, scope="bucket")
+
+
+# Function to start counting discord.py's rate limit warnings
+def install_rate_limit_counter():
+    http_logger = logging.getLogger("discord.http")
+    if not any(isinstance(handler, RateLimitLogHandler) for handler in http_logger.handlers):
+        http_logger.addHandler(RateLimitLogHandler(logging.WARNING))
+
+
+# Function to serve the registry at http://host:port/metrics; returns the runner to clean up, or None
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,169 @@
+import asyncio
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Opt-in profiling for production. Start a session with the !profile owner
+# command or by setting GOKU_PROFILE=<seconds> before launching the bot. For
+# the length of the window it records:
+#
+#   <stamp>-loop.prof       cProfile of the event-loop thread (snakeviz, pstats)
+#   <stamp>-render.prof     cProfile of render calls in the render worker (Pillow)
+#   <stamp>-stacks.folded   sampled stacks of every thread, in the collapsed
+#                           format flamegraph.pl and speedscope read
+#   <stamp>-summary.json    calls and wall time of each @profiled hot path
+#
+# Outside a session the @profiled wrappers cost one attribute check.
+
+PROFILE_ENV_VAR = "GOKU_PROFILE"  # Seconds to profile from startup
+PROFILE_DIR = "./profiles/"
+PROFILE_WINDOW = 60  # Default session length in seconds
+PROFILE_MAX_WINDOW = 900
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileSession:
+    """One profiling window: cProfile on the loop thread plus a stack sampler thread."""
+
+    def __init__(self, directory=PROFILE_DIR, sample_interval=PROFILE_SAMPLE_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, time.strftime('%Y%m%d-%H%M%S'))
+        self.sample_interval = sample_interval
+        self.render_profile_path = f"{self.prefix}-render.prof"
+        self.hot_paths = defaultdict(list)  # name -> wall times in seconds
+        self._profile = cProfile.Profile()
+        self._stacks = Counter()
+        self._stopping = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self.started_at = None
+
+    def start(self):
+        """Call on the event-loop thread; cProfile only sees the thread that enables it."""
+        self.started_at = time.monotonic()
+        self._profile.enable()
+        self._sampler.start()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """Stop recording and write the output files; returns their paths."""
+        self._profile.disable()
+        self._stopping.set()
+        self._sampler.join()
+
+        paths = [f"{self.prefix}-loop.prof", f"{self.prefix}-stacks.folded", f"{self.prefix}-summary.json"]
+        self._profile.dump_stats(paths[0])
+        with open(paths[1], "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = {
+            name: {
+                "calls": len(times),
+                "total_s": round(sum(times), 4),
+                "max_s": round(max(times), 4),
+            }
+            for name, times in self.hot_paths.items()
+        }
+        summary["window_s"] = round(time.monotonic() - self.started_at, 1)
+        with open(paths[2], "w") as f:
+            json.dump(summary, f, indent=2)
+        if os.path.exists(self.render_profile_path):
+            paths.append(self.render_profile_path)
+        return paths
+
+
+# The running session, if any (only one at a time)
+session = None
+
+
+# Function to start a session; returns it, or None if one is already running
+def start_profiling():
+    global session
+    if session is not None:
+        return None
+    session = ProfileSession()
+    session.start()
+    logger.info(f"Profiling started, writing to {session.prefix}-*")
+    return session
+
+
+# Function to end the running session (only if it is still `expected`) and write its files
+def stop_profiling(expected=None):
+    global session
+    if session is None or (expected is not None and session is not expected):
+        return []
+    current, session = session, None
+    paths = current.stop()
+    logger.info(f"Profiling stopped: {', '.join(paths)}")
+    return paths
+
+
+# Function to profile for a number of seconds; returns the files written, or None if busy
+async def profile_for(seconds):
+    current = start_profiling()
+    if current is None:
+        return None
+    await asyncio.sleep(seconds)
+    return stop_profiling(current)
+
+
+# Function to read the startup profiling window from the environment (0 if unset)
+def startup_window():
+    try:
+        return min(float(os.getenv(PROFILE_ENV_VAR, "0")), PROFILE_MAX_WINDOW)
+    except ValueError:
+        logger.error(f"{PROFILE_ENV_VAR} must be a number of seconds")
+        return 0
+
+
+# Decorator to time a hot-path coroutine while a session is running
+def profiled(coro):
+    @functools.wraps(coro)
+    async def wrapper(*args, **kwargs):
+        current = session
+        if current is None:
+            return await coro(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await coro(*args, **kwargs)
+        finally:
+            current.hot_paths[coro.__name__].append(time.perf_counter() - started)
+    return wrapper
+
+
+# Worker-side profiles, one per session file, accumulated across render calls
+_worker_profiles = {}
+
+
+# Function to run fn under cProfile in the render worker, merging into path
+def profile_call(path, fn, *args):
+    profile = _worker_profiles.get(path)
+    if profile is None:
+        profile = _worker_profiles[path] = cProfile.Profile()
+    profile.enable()
+    try:
+        return fn(*args)
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,40 @@
+import hashlib
+
+from coalescing_cache import CoalescingCache
+from leaderboard_render import row_tile_key
+
+RENDER_CACHE_ITEMS = 16  # Rendered leaderboards kept in memory
+
+
+# Function to hash the leaderboard model: what each row shows, not the pixels
+def leaderboard_model_key(rows):
+    # Rank, user, nickname, avatar hash and XP as displayed, and whether the
+    # avatar could be fetched (a row drawn without it must be drawn again)
+    model = [row_tile_key(row) for row in rows]
+    return hashlib.sha256(repr(model).encode("utf-8")).hexdigest()
+
+
+class RenderCache(CoalescingCache):
+    """
+    Rendered leaderboard PNGs, keyed by leaderboard_model_key.
+
+    The publisher and !live share renders through it: a model that was drawn
+    recently is served from memory, and concurrent requests for the same
+    model wait on a single render (get(key, render, *args)).
+    """
+
+    def __init__(self, max_items=RENDER_CACHE_ITEMS):
+        super().__init__(max_items)
+
+    def stats(self):
+        requests = self.hits + self.shared + self.loads
+        return {
+            "hits": self.hits,
+            "shared": self.shared,
+            "renders": self.loads,
+            "hit_rate": (self.hits + self.shared) / requests if requests else 0.0,
+            "size": len(self),
+        }
+
+
+render_cache = RenderCache()
@@ -0,0 +1,127 @@
+import logging
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from emoji_tokens import emoji_file_keys
+
+# Fonts, masks and pre-rendered glyphs shared by every leaderboard render.
+# Everything is built on first use and kept for the life of the process.
+
+FONT_PATH = "TT Fors Trial Bold.ttf"  # Adjust the path as needed
+FONT_SIZE = 28
+TEXT_STROKE_WIDTH = 2  # Outline around rank labels, nicknames and XP
+SEPARATOR_OUTLINE_WIDTH = 2  # Outline around the "|" separators
+EMOJI_SIZE = 28  # Size emojis are drawn at in nicknames
+
+# Directory where emoji images are stored, one PNG per emoji named by its
+# codepoints (e.g. 1f600.png, 1f468-200d-1f4bb.png)
+EMOJI_DIR = "./emoji_images/"  # Update this to the correct path where emojis are saved
+
+logger = logging.getLogger(__name__)
+
+# A pre-rendered RGBA glyph. Composite image at (x + offset[0], y + offset[1]) to
+# match draw.text at (x, y); bbox is what draw.textbbox((0, 0), ...) returns.
+Sprite = namedtuple("Sprite", ["image", "offset", "bbox"])
+
+
+@lru_cache(maxsize=None)
+def get_font(size=FONT_SIZE):
+    try:
+        # Load the font from the local cache
+        return ImageFont.truetype(FONT_PATH, size=size)
+    except IOError:
+        logger.error("Failed to load custom font. Using default font instead.")
+        return ImageFont.load_default()  # Fallback to default font
+
+
+# Function to create a rounded mask for profile pictures; masks are shared, don't modify them
+@lru_cache(maxsize=32)
+def create_rounded_mask(size, radius=10):  # Reduced the radius to 10 for less rounding
+    mask = Image.new('L', size, 0)  # 'L' mode creates a grayscale image
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle([(0, 0), size], radius=radius, fill=255)  # Adjusted radius
+    return mask
+
+
+def _text_sprite(text, font, stroke_width):
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width)
+    image = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.text((-left, -top), text, font=font, fill="white", stroke_width=stroke_width, stroke_fill="black")
+    return Sprite(image, (left, top), draw.textbbox((0, 0), text, font=font))
+
+
+# Outlined rank label such as "#1", as drawn with draw.text(..., stroke_width=2)
+@lru_cache(maxsize=None)
+def rank_label_sprite(rank, size=FONT_SIZE):
+    return _text_sprite(f"#{rank}", get_font(size), TEXT_STROKE_WIDTH)
+
+
+# The "|" separator: the glyph drawn in black at every offset within the outline
+# width, then in white on top. Rendering it once replaces 26 draw.text calls.
+@lru_cache(maxsize=None)
+def separator_sprite(size=FONT_SIZE):
+    font = get_font(size)
+    outline = SEPARATOR_OUTLINE_WIDTH
+    left, top, right, bottom = font.getbbox("|")
+    image = Image.new("RGBA", (right - left + 2 * outline, bottom - top + 2 * outline), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    origin = (outline - left, outline - top)
+    for x_offset in range(-outline, outline + 1):
+        for y_offset in range(-outline, outline + 1):
+            draw.text((origin[0] + x_offset, origin[1] + y_offset), "|", font=font, fill="black")
+    draw.text(origin, "|", font=font, fill="white")
+    return Sprite(image, (left - outline, top - outline), draw.textbbox((0, 0), "|", font=font))
+
+
+# Function to draw a sprite onto an RGBA image as if its text were drawn at position
+def paste_sprite(img, sprite, position):
+    img.alpha_composite(sprite.image, (position[0] + sprite.offset[0], position[1] + sprite.offset[1]))
+
+
+# Every emoji PNG, converted to RGBA and resized once: {size: {file key: image}}
+_emoji_atlas = {}
+
+
+def load_emoji_atlas(size=EMOJI_SIZE):
+    atlas = _emoji_atlas.get(size)
+    if atlas is not None:
+        return atlas
+
+    atlas = {}
+    if os.path.isdir(EMOJI_DIR):
+        for filename in os.listdir(EMOJI_DIR):
+            key, extension = os.path.splitext(filename)
+            if extension.lower() != ".png":
+                continue
+            try:
+                with Image.open(os.path.join(EMOJI_DIR, filename)) as img:
+                    atlas[key] = img.convert("RGBA").resize((size, size))
+            except Exception as e:
+                logger.error(f"Failed to open image for emoji {key}: {e}")
+    _emoji_atlas[size] = atlas
+    return atlas
+
+
+# Function to get a pre-resized RGBA image for an emoji sequence, or None if there is no PNG for it
+def emoji_sprite(sequence, size=EMOJI_SIZE):
+    atlas = load_emoji_atlas(size)
+    keys = emoji_file_keys(sequence)
+    for key in keys:
+        if key in atlas:
+            return atlas[key]
+    logger.warning(f"Emoji image not found for {sequence} in {EMOJI_DIR}")
+    atlas[keys[0]] = None  # Only warn once per emoji
+    return None
+
+
+# Function to build everything above ahead of the first render
+def warm_up():
+    get_font()
+    separator_sprite()
+    for rank in range(1, 11):
+        rank_label_sprite(rank)
+    return len(load_emoji_atlas())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from db_executor import db
+from db_server import seed_scheduled_job
+
+# Daily and weekly resets, scheduled from the scheduled_jobs table instead of
+# in-process timers, so restarts and reconnects don't move them.
+#
+# Each job has a UTC next_run. When it is due the job's action gets a JobRun
+# and must pass it to a db_server function that records it with
+# complete_job_run in the same transaction as the job's work. The record only
+# applies while next_run is still the time that was run, so a run commits at
+# most once. After downtime a job runs once, however many runs it missed, and
+# next_run moves to the first time after now on its original cadence.
+
+SCHEDULER_MAX_SLEEP = 300  # Re-read the schedule at least this often (seconds)
+SCHEDULER_RETRY_DELAY = 60  # Seconds before retrying a failed run
+
+logger = logging.getLogger(__name__)
+
+# One execution of a job; times are UTC ISO 8601 strings as stored in the table
+JobRun = namedtuple("JobRun", ["name", "run_id", "scheduled_for", "next_run", "started_at"])
+
+
+# Function to get the current time in UTC
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+# Function to find the first run time after now, keeping the cadence of scheduled_for
+def following_run(scheduled_for, interval, now):
+    missed = (now - scheduled_for) // interval  # Whole intervals between the due time and now
+    return scheduled_for + interval * (missed + 1)
+
+
+# Function to read a last-run time from the pre-scheduler text files (naive local time), or None
+def read_legacy_last_run(path):
+    try:
+        with open(path) as f:
+            return datetime.fromisoformat(f.read().strip()).astimezone(timezone.utc)
+    except (OSError, ValueError):
+        return None
+
+
+class Job:
+    def __init__(self, name, interval, action, legacy_file=None):
+        self.name = name
+        self.interval = interval
+        self.action = action  # Coroutine function taking a JobRun
+        self.legacy_file = legacy_file  # Seeds the first run when the job is not in the table yet
+
+
+class Scheduler:
+    """Runs jobs stored in scheduled_jobs, one task per job (see the notes above)."""
+
+    def __init__(self):
+        self.jobs = []
+        self._tasks = []
+
+    def add_job(self, name, interval, action, legacy_file=None):
+        self.jobs.append(Job(name, interval, action, legacy_file))
+
+    def start(self):
+        """Start every job; does nothing if they are already running (on_ready runs on every reconnect)."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._run_job(job)) for job in self.jobs]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _seed(self, job):
+        last_run = read_legacy_last_run(job.legacy_file) if job.legacy_file else None
+        first_run = (last_run or utc_now()) + job.interval
+        await db.write(seed_scheduled_job, job.name, int(job.interval.total_seconds()), first_run.isoformat())
+        if last_run:
+            logger.info(f"Seeded {job.name} from {job.legacy_file}: next run {first_run.isoformat()}")
+
+    async def _next_run(self, job):
+        row = await db.fetchone("SELECT next_run FROM scheduled_jobs WHERE name = ?", (job.name,))
+        if row is None:
+            await self._seed(job)
+            row = await db.fetchone("SELECT next_run FROM scheduled_jobs WHERE name = ?", (job.name,))
+        return datetime.fromisoformat(row[0])
+
+    async def _run_job(self, job):
+        announced = None
+        while True:
+            try:
+                scheduled_for = await self._next_run(job)
+                now = utc_now()
+                if scheduled_for > now:
+                    if scheduled_for != announced:
+                        logger.info(f"Next {job.name} at {scheduled_for.isoformat()} ({scheduled_for - now} from now)")
+                        announced = scheduled_for
+                    await asyncio.sleep(min((scheduled_for - now).total_seconds(), SCHEDULER_MAX_SLEEP))
+                    continue
+
+                if now - scheduled_for > job.interval:
+                    logger.warning(f"{job.name} was due at {scheduled_for.isoformat()}; catching up with one run")
+                run = JobRun(
+                    name=job.name,
+                    run_id=f"{job.name}@{scheduled_for.isoformat()}",
+                    scheduled_for=scheduled_for.isoformat(),
+                    next_run=following_run(scheduled_for, job.interval, now).isoformat(),
+                    started_at=now.isoformat(),
+                )
+                await job.action(run)
+                logger.info(f"Completed {run.run_id}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error running {job.name}: {e}")
+                await asyncio.sleep(SCHEDULER_RETRY_DELAY)
+
+
+scheduler = Scheduler()
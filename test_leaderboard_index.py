@@ -0,0 +1,111 @@
+import random
+import unittest
+
+from leaderboard_index import LeaderboardIndex
+
+
+# Function to rank {user_id: xp} the slow way: highest XP first, ties by user ID
+def reference_order(scores):
+    return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+
+
+class TestLeaderboardIndex(unittest.TestCase):
+
+    def assertMatches(self, index, scores):
+        order = reference_order(scores)
+        self.assertEqual(len(index), len(order))
+        self.assertEqual(index.top(len(order) + 5), order)
+        self.assertEqual(index.top(10), order[:10])
+        for rank, (user_id, xp) in enumerate(order, 1):
+            self.assertEqual(index.rank(user_id), rank)
+            self.assertEqual(index.at(rank), (user_id, xp))
+            self.assertEqual(index.xp(user_id), xp)
+        self.assertIsNone(index.at(0))
+        self.assertIsNone(index.at(len(order) + 1))
+
+    def test_random_updates_match_sorted_list(self):
+        rng = random.Random(4)
+        index, scores = LeaderboardIndex(), {}
+        for step in range(2000):
+            user_id = rng.randrange(200)
+            action = rng.random()
+            if action < 0.4:
+                xp = rng.randrange(500)  # Small range, so ties are common
+                index.set(user_id, xp)
+                scores[user_id] = xp
+            elif action < 0.85:
+                delta = rng.randrange(1, 50)
+                self.assertEqual(index.add(user_id, delta), scores.get(user_id, 0) + delta)
+                scores[user_id] = scores.get(user_id, 0) + delta
+            else:
+                index.remove(user_id)
+                scores.pop(user_id, None)
+                self.assertIsNone(index.rank(user_id))
+            if step % 100 == 0:
+                self.assertMatches(index, scores)
+        self.assertMatches(index, scores)
+
+    def test_rebuild_sums_rows_per_user(self):
+        index = LeaderboardIndex()
+        index.set(99, 1000)  # Dropped by the rebuild
+        index.rebuild([(1, 10), (2, 30), (1, 25), (3, 30)])
+        self.assertMatches(index, {1: 35, 2: 30, 3: 30})
+
+    def test_range_and_around(self):
+        index = LeaderboardIndex()
+        index.rebuild((user_id, user_id * 10) for user_id in range(1, 21))
+        self.assertEqual(index.range(19, 5), [(19, 2, 20), (20, 1, 10)])
+        self.assertEqual(index.around(1), [(1, 20, 200), (2, 19, 190), (3, 18, 180)])
+        self.assertEqual([rank for rank, _, _ in index.around(10)], [8, 9, 10, 11, 12])
+        self.assertEqual(index.range(21, 3), [])
+
+
+class TestTopChange(unittest.TestCase):
+
+    def setUp(self):
+        self.index = LeaderboardIndex(top_n=10)
+        self.index.rebuild((user_id, 1000 - user_id * 10) for user_id in range(30))  # 0..9 are the top 10
+        self.changes = 0
+        self.index.on_top_change(self.count_change)
+
+    def count_change(self):
+        self.changes += 1
+
+    def assertTopChange(self, update, changed):
+        before = self.index.top(10)
+        self.changes = 0
+        update()
+        self.assertEqual(self.index.top(10) != before, changed)
+        self.assertEqual(self.changes, 1 if changed else 0)
+
+    def test_updates_below_the_top_are_silent(self):
+        self.assertTopChange(lambda: self.index.add(25, 5), False)
+        self.assertTopChange(lambda: self.index.remove(20), False)
+        self.assertTopChange(lambda: self.index.set(100, 1), False)  # New user at the bottom
+        self.assertTopChange(lambda: self.index.set(15, self.index.xp(15)), False)
+
+    def test_updates_in_the_top_fire(self):
+        self.assertTopChange(lambda: self.index.add(3, 1), True)  # XP changes, order doesn't
+        self.assertTopChange(lambda: self.index.add(9, 500), True)  # Order changes
+        self.assertTopChange(lambda: self.index.remove(0), True)
+
+    def test_entering_and_leaving_the_top_fire(self):
+        self.assertTopChange(lambda: self.index.add(12, 300), True)  # 12 climbs in, one drops out
+        self.assertTopChange(lambda: self.index.set(12, 0), True)  # And falls back out
+        self.assertTopChange(lambda: self.index.set(200, 5000), True)  # New user straight to #1
+
+    def test_random_updates_fire_exactly_on_top_changes(self):
+        rng = random.Random(10)
+        for _ in range(1000):
+            user_id = rng.randrange(40)
+            before = self.index.top(10)
+            self.changes = 0
+            if rng.random() < 0.8:
+                self.index.add(user_id, rng.randrange(-40, 60))
+            else:
+                self.index.remove(user_id)
+            self.assertEqual(self.changes, 1 if self.index.top(10) != before else 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import unittest
+
+from metrics import DISCORD_RATE_LIMITS, RateLimitLogHandler
+
+# The warnings discord.py 1.7.3 logs for a 429 (discord/http.py)
+BUCKET_FMT = 'We are being rate limited. Retrying in %.2f seconds. Handled under the bucket "%s"'
+GLOBAL_FMT = 'Global rate limit has been hit. Retrying in %.2f seconds.'
+
+
+class TestRateLimitLogHandler(unittest.TestCase):
+
+    def setUp(self):
+        DISCORD_RATE_LIMITS._values.clear()
+        self.handler = RateLimitLogHandler(logging.WARNING)
+        self.log = logging.getLogger("discord.http")
+        self.log.addHandler(self.handler)
+        self.log.propagate = False
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        self.log.propagate = True
+        self.loop.close()
+        DISCORD_RATE_LIMITS._values.clear()
+
+    def counts(self):
+        return {key[0]: value for key, value in DISCORD_RATE_LIMITS._values.items()}
+
+    def handle_429(self, is_global):
+        # Logged back to back, as discord.py does before it sleeps
+        async def request():
+            self.log.warning(BUCKET_FMT, 1.5, "None:None:/channels/1/messages")
+            if is_global:
+                self.log.warning(GLOBAL_FMT, 1.5)
+            await asyncio.sleep(0)
+        self.loop.run_until_complete(request())
+
+    def test_bucket_429_counted_once(self):
+        self.handle_429(is_global=False)
+        self.assertEqual(self.counts(), {"bucket": 1})
+
+    def test_global_429_counted_once(self):
+        self.handle_429(is_global=True)
+        self.assertEqual(self.counts(), {"global": 1})
+
+    def test_mixed_429s(self):
+        self.handle_429(is_global=False)
+        self.handle_429(is_global=True)
+        self.handle_429(is_global=False)
+        self.assertEqual(self.counts(), {"bucket": 2, "global": 1})
+
+    def test_outside_event_loop(self):
+        self.log.warning(BUCKET_FMT, 1.5, "None:None:/channels/1/messages")
+        self.assertEqual(self.counts(), {"bucket": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+# db_server opens database.db in the working directory on import, so the
+# modules under test are imported from a scratch directory in setUpModule
+db_server = None
+scheduler = None
+_previous_cwd = None
+_workdir = None
+
+DAY = timedelta(days=1)
+
+
+def setUpModule():
+    global db_server, scheduler, _previous_cwd, _workdir
+    _previous_cwd = os.getcwd()
+    _workdir = tempfile.mkdtemp(prefix="goku-test-")
+    os.chdir(_workdir)
+    import db_server
+    import scheduler
+
+
+def tearDownModule():
+    os.chdir(_previous_cwd)
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+# Function to build the run the scheduler would make for a job due at scheduled_for
+def make_run(name, scheduled_for, now, interval=DAY):
+    return scheduler.JobRun(
+        name=name,
+        run_id=f"{name}@{scheduled_for.isoformat()}",
+        scheduled_for=scheduled_for.isoformat(),
+        next_run=scheduler.following_run(scheduled_for, interval, now).isoformat(),
+        started_at=now.isoformat(),
+    )
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = db_server.conn.cursor()
+        for table in ("scheduled_jobs", "user_xp", "clan_xp", "clan_totals"):
+            self.cursor.execute(f"DELETE FROM {table}")
+        db_server.conn.commit()
+
+    def add_xp(self, user_id, xp):
+        self.cursor.execute("INSERT INTO user_xp (user_id, xp) VALUES (?, ?)", (str(user_id), xp))
+        db_server.conn.commit()
+
+    def user_xp_rows(self):
+        return self.cursor.execute("SELECT count(*) FROM user_xp").fetchone()[0]
+
+    def job(self, name):
+        return self.cursor.execute(
+            "SELECT next_run, last_run_id FROM scheduled_jobs WHERE name = ?", (name,)).fetchone()
+
+
+class TestCompleteJobRun(SchedulerTestCase):
+
+    def test_reset_commits_once_per_run(self):
+        due = datetime(2024, 1, 1, 6, tzinfo=timezone.utc)
+        db_server.seed_scheduled_job("daily_reset", 86400, due.isoformat())
+        run = make_run("daily_reset", due, due + timedelta(minutes=1))
+
+        self.add_xp(1, 50)
+        self.assertEqual(db_server.reset_user_xp(run), db_server.RESET_DONE)
+        self.assertEqual(self.user_xp_rows(), 0)
+        self.assertEqual(self.job("daily_reset"), ((due + DAY).isoformat(), run.run_id))
+
+        # Replaying the same run (a retry, or a second process) changes nothing
+        self.add_xp(2, 70)
+        self.assertEqual(db_server.reset_user_xp(run), db_server.RESET_SKIPPED)
+        self.assertEqual(self.user_xp_rows(), 1)
+        self.assertEqual(self.job("daily_reset"), ((due + DAY).isoformat(), run.run_id))
+
+    def test_only_one_of_two_concurrent_runs_commits(self):
+        due = datetime(2024, 1, 1, 6, tzinfo=timezone.utc)
+        db_server.seed_scheduled_job("weekly_reset", 604800, due.isoformat())
+        first = make_run("weekly_reset", due, due + timedelta(seconds=1), timedelta(weeks=1))
+        second = make_run("weekly_reset", due, due + timedelta(seconds=2), timedelta(weeks=1))
+
+        self.cursor.execute("INSERT INTO clan_totals (clan_id, xp) VALUES ('10', 40)")
+        db_server.conn.commit()
+        self.assertEqual(db_server.reset_clan_tables(first), (db_server.RESET_DONE, [("10", 40)]))
+        self.assertEqual(db_server.reset_clan_tables(second), (db_server.RESET_SKIPPED, []))
+        self.assertEqual(self.job("weekly_reset")[1], first.run_id)
+
+    def test_failed_reset_leaves_the_run_due(self):
+        due = datetime(2024, 1, 1, 6, tzinfo=timezone.utc)
+        db_server.seed_scheduled_job("daily_reset", 86400, due.isoformat())
+        run = make_run("daily_reset", due, due + timedelta(minutes=1))
+        self.add_xp(1, 50)
+
+        # Make the DELETE fail after the run was recorded in the same transaction
+        self.cursor.execute(
+            "CREATE TEMP TRIGGER block_reset BEFORE DELETE ON user_xp BEGIN SELECT RAISE(ABORT, 'blocked'); END")
+        try:
+            self.assertEqual(db_server.reset_user_xp(run), db_server.RESET_FAILED)
+        finally:
+            self.cursor.execute("DROP TRIGGER block_reset")
+        self.assertEqual(self.job("daily_reset"), (due.isoformat(), None))
+        self.assertEqual(self.user_xp_rows(), 1)
+
+        # So the retry of the same run still goes through
+        self.assertEqual(db_server.reset_user_xp(run), db_server.RESET_DONE)
+        self.assertEqual(self.user_xp_rows(), 0)
+
+
+class TestCatchUp(unittest.TestCase):
+
+    def test_following_run_keeps_the_cadence(self):
+        due = datetime(2024, 1, 1, 6, tzinfo=timezone.utc)
+        self.assertEqual(scheduler.following_run(due, DAY, due), due + DAY)
+        self.assertEqual(scheduler.following_run(due, DAY, due + timedelta(hours=5)), due + DAY)
+        # Three and a half days late: the next run is the first 06:00 after now
+        self.assertEqual(scheduler.following_run(due, DAY, due + timedelta(days=3, hours=12)), due + 4 * DAY)
+        self.assertEqual(scheduler.following_run(due, DAY, due + 3 * DAY), due + 4 * DAY)
+
+
+class TestSchedulerLoop(SchedulerTestCase):
+
+    def test_missed_runs_run_once(self):
+        now = scheduler.utc_now()
+        due = now - timedelta(days=3, hours=2)  # Three runs missed
+        db_server.seed_scheduled_job("daily_reset", 86400, due.isoformat())
+        self.add_xp(1, 50)
+
+        runs = []
+
+        async def reset(run):
+            runs.append(run)
+            self.assertEqual(await scheduler.db.write(db_server.reset_user_xp, run), db_server.RESET_DONE)
+
+        async def main():
+            jobs = scheduler.Scheduler()
+            jobs.add_job("daily_reset", DAY, reset)
+            jobs.start()
+            await asyncio.sleep(0.5)
+            jobs.stop()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(main())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0].scheduled_for, due.isoformat())
+        next_run = datetime.fromisoformat(self.job("daily_reset")[0])
+        self.assertEqual(next_run, due + 4 * DAY)
+        self.assertGreater(next_run, now)
+        self.assertEqual(self.user_xp_rows(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import random
+import re
+import unittest
+
+import emoji
+
+from xp_scorer import URL_REGEX, XPBreakdown, XPScorer, xp_scorer
+
+
+# Function to score a message the way on_message did before XPScorer
+def baseline_score(content):
+    filtered_content = re.sub(URL_REGEX, "", content)
+    filtered_content = ''.join(c for c in filtered_content if c.isalnum() or c.isspace())
+    character_xp = len(filtered_content.replace(" ", ""))
+    custom_emoji_count = len(re.findall(r'<a?:\w+:\d+>', content))
+    unicode_emoji_count = sum(1 for c in content if emoji.is_emoji(c))
+    return character_xp + (custom_emoji_count + unicode_emoji_count) * 5
+
+
+class TestBaselineParity(unittest.TestCase):
+    """Messages without multi-codepoint emoji score exactly as before."""
+
+    def assertParity(self, content):
+        self.assertEqual(xp_scorer.score(content), baseline_score(content), repr(content))
+
+    def test_plain_text(self):
+        for content in ["hello world", "ab_cd!?", "Ça va? 漢字 ñ 123", "line one\nline two\ttab", "   ", "..."]:
+            self.assertParity(content)
+
+    def test_custom_emoji(self):
+        for content in ["<:pepe:123>", "<a:dance:456> hi", "gg <:kek:1><:kek:1>", "<:bad name:1>", "<:x:>"]:
+            self.assertParity(content)
+
+    def test_single_codepoint_emoji(self):
+        for content in ["😀", "nice 👍 one", "❤️", "🔥🔥🔥", "✨ sparkle ✨"]:
+            self.assertParity(content)
+
+    def test_links(self):
+        for content in ["see https://example.com/a?b=1 now", "http://x.y and https://z.w/q", "https://only.link"]:
+            self.assertParity(content)
+
+    def test_limits(self):
+        self.assertParity("")
+        self.assertParity("a" * 2000)  # Discord's message length limit
+        self.assertParity("😀" * 2000)
+        self.assertParity(("word <:e:1> 😀 https://l.ink/x " * 80)[:2000])
+
+    def test_generated_messages(self):
+        rng = random.Random(13)
+        pieces = ["hello", "XP", "123", " ", "\n", "!!", "<:pepe:123>", "<a:dance:4>", "😀", "🎉", "ñ", "_",
+                  "https://example.com/page ", "漢字"]
+        for _ in range(500):
+            self.assertParity("".join(rng.choice(pieces) for _ in range(rng.randrange(20))))
+
+
+class TestIntendedChanges(unittest.TestCase):
+    """Where XPScorer deliberately differs from the old code."""
+
+    def test_sequences_count_once(self):
+        # The old per-codepoint scan counted the parts of multi-codepoint emoji
+        cases = {
+            "👍🏽": 5,  # Skin tone
+            "👋🏻👋": 10,
+            "👨‍💻": 5,  # ZWJ sequence
+            "👨‍👩‍👧": 5,
+            "🏳️‍🌈": 5,
+            "🇺🇸": 5,  # Flag
+            "1️⃣": 6,  # Keycap: the digit still counts as a character
+            "ok 👍🏽": 7,
+        }
+        for content, xp in cases.items():
+            self.assertEqual(xp_scorer.score(content), xp, repr(content))
+
+    def test_text_glued_to_a_link_is_part_of_it(self):
+        # The old code dropped the link's characters but still paid for the custom emoji in it
+        self.assertEqual(xp_scorer.score("see https://x.y/z<:pepe:1> ok"), 5)
+        self.assertEqual(baseline_score("see https://x.y/z<:pepe:1> ok"), 10)
+
+
+class TestRules(unittest.TestCase):
+
+    def test_breakdown(self):
+        self.assertEqual(
+            xp_scorer.breakdown("hi <:pepe:123> 👨‍💻 https://x.y/z"),
+            XPBreakdown(characters=9, custom_emoji=1, unicode_emoji=1, urls=1, xp=19),  # "pepe123" counts too
+        )
+
+    def test_overrides(self):
+        scorer = XPScorer({"unicode_emoji": 3, "url": 2})
+        self.assertEqual(scorer.score("ab 😀 https://x.y"), 2 + 3 + 2)
+        self.assertEqual(xp_scorer.score("ab 😀 https://x.y"), 2 + 5)
+
+    def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            XPScorer({"sticker": 5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import re
+from collections import namedtuple
+
+from emoji_tokens import EMOJI_START_CHARS, EMOJI_SEQUENCE_REGEX
+
+# XP awarded per item found in a message. Any rule can be overridden by
+# passing a dict to XPScorer, e.g. XPScorer({"unicode_emoji": 3}).
+#
+#   character      per letter or digit (str.isalnum), plus per whitespace
+#                  character other than a plain space (newlines, tabs)
+#   custom_emoji   per Discord emoji such as <:name:123> or <a:name:123>
+#   unicode_emoji  per emoji sequence; 👨‍💻 and 👍🏽 count once
+#   url            per link; the link's own characters never earn XP
+#
+# As before, the letters and digits inside custom emoji markup and keycap
+# digits such as 1️⃣ also count as characters. Anything glued to the end of a
+# link without a space in between is part of the link.
+DEFAULT_XP_RULES = {
+    "character": 1,
+    "custom_emoji": 5,
+    "unicode_emoji": 5,
+    "url": 0,
+}
+
+URL_REGEX = r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+CUSTOM_EMOJI_REGEX = r"<a?:\w+:\d+>"
+
+# Everything that earns XP other than plain characters, found in one scan. The
+# leading lookahead rejects a character that cannot start a token in one step.
+TOKEN_PATTERN = re.compile(
+    f"(?=[h<{EMOJI_START_CHARS}])(?:"
+    f"(?P<url>{URL_REGEX})"
+    f"|(?P<custom_emoji>{CUSTOM_EMOJI_REGEX})"
+    f"|(?P<unicode_emoji>{EMOJI_SEQUENCE_REGEX})"
+    ")"
+)
+
+# ASCII characters that do not earn character XP: anything but letters, digits
+# and whitespace, plus "_" and the plain space
+UNCOUNTED_ASCII = bytes(b for b in range(128) if not (chr(b).isalnum() or chr(b).isspace()) or chr(b) in "_ ")
+NON_ASCII_PATTERN = re.compile(r"[^\x00-\x7f]+")
+
+
+# Function to count the characters in text that earn character XP. The ASCII
+# part goes through bytes.translate; only the (usually short) non-ASCII runs,
+# mostly emoji, are checked one character at a time.
+def count_characters(text):
+    count = len(text.encode("ascii", "ignore").translate(None, UNCOUNTED_ASCII))
+    if not text.isascii():
+        for run in NON_ASCII_PATTERN.findall(text):
+            count += sum(1 for char in run if char.isalnum() or char.isspace())
+    return count
+
+
+# Item counts for one message and the XP they add up to
+XPBreakdown = namedtuple("XPBreakdown", ["characters", "custom_emoji", "unicode_emoji", "urls", "xp"])
+
+
+class XPScorer:
+    """
+    Scores a message's XP in a single pass over its content.
+
+    TOKEN_PATTERN finds links, custom emoji and unicode emoji sequences in
+    one scan; the characters outside links are then counted in C
+    (count_characters) and the rule table turns the counts into XP.
+    breakdown() returns the counts alongside the total.
+    """
+
+    def __init__(self, rules=None):
+        unknown = set(rules or ()) - set(DEFAULT_XP_RULES)
+        if unknown:
+            raise ValueError(f"Unknown XP rules: {', '.join(sorted(unknown))}")
+        self.rules = dict(DEFAULT_XP_RULES, **(rules or {}))
+
+    def breakdown(self, content):
+        """Return an XPBreakdown of everything in content that earns XP."""
+        custom_emoji = unicode_emoji = 0
+        urls = []
+        for match in TOKEN_PATTERN.finditer(content):
+            kind = match.lastgroup
+            if kind == "unicode_emoji":
+                unicode_emoji += 1
+            elif kind == "custom_emoji":
+                custom_emoji += 1
+            else:
+                urls.append(match.span())
+
+        # Characters are counted over the message with the links cut out
+        if urls:
+            parts, position = [], 0
+            for start, end in urls:
+                parts.append(content[position:start])
+                position = end
+            parts.append(content[position:])
+            content = "".join(parts)
+        characters = count_characters(content)
+
+        rules = self.rules
+        xp = (characters * rules["character"] + custom_emoji * rules["custom_emoji"]
+              + unicode_emoji * rules["unicode_emoji"] + len(urls) * rules["url"])
+        return XPBreakdown(characters, custom_emoji, unicode_emoji, len(urls), xp)
+
+    def score(self, content):
+        """Return the XP a message with this content earns."""
+        return self.breakdown(content).xp
+
+
+# Scorer used by on_message
+xp_scorer = XPScorer()